@@ -0,0 +1,183 @@
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import perf_counter
+from traceback import format_exc
+from typing import List, Dict, Iterator, Optional
+
+from yaml import load as load_yaml, SafeLoader
+
+from oak.html.html import Page, render_html, render_site_index
+from oak.jsonresume.jsonresume import render_json, jsonl_record
+from oak.md.md import render_md
+from oak.model import get_all_data
+from oak.pdf.pdf import render_modern_cv
+from oak.profile import Profile
+from oak.translation.translation import get_translations
+
+
+RENDERERS = {
+    "md": render_md,
+    "jsonresume": render_json,
+    "html": render_html,
+    "pdf": render_modern_cv,
+}
+# Every resume of the batch goes to one JSON Lines stream instead of a file per variant
+JSONL_FORMAT = "jsonl"
+JSONL_FILE = "resumes.jsonl"
+
+
+@dataclass(frozen=True)
+class Source:
+    name: str
+    data_file: Path
+    langs: List[str]
+    profiles: List[Profile]
+
+
+@dataclass
+class SourceResult:
+    source: Source
+    artifacts: List[Path] = field(default_factory=list)
+    timings: Dict[str, List[float]] = field(default_factory=dict)
+    records: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+def _parse_profiles(profiles: List[Dict]) -> List[Profile]:
+    return [
+        Profile(
+            name=p["name"],
+            job_title=p["job_title"],
+            render_profiles=frozenset(p.get("render_profiles", [])),
+        )
+        for p in profiles
+    ]
+
+
+def find_sources(path: Path, langs: List[str], profiles: List[Profile]) -> Iterator[Source]:
+    # Directory is scanned for CV sources, a file is a manifest with optional per-source langs and profiles:
+    #
+    # langs: [en]
+    # profiles: [{name: teamlead, job_title: Team Lead, render_profiles: [teamlead]}]
+    # sources:
+    # - data: alice/data.yaml
+    #   langs: [en, ru]
+    if path.is_dir():
+        for data_file in sorted(path.rglob("*.yaml")):
+            name = str(data_file.relative_to(path).with_suffix(""))
+            yield Source(name=name, data_file=data_file, langs=langs, profiles=profiles)
+        return
+
+    manifest = load_yaml(path.read_text(), Loader=SafeLoader)
+    langs = manifest.get("langs", langs)
+    profiles = _parse_profiles(manifest["profiles"]) if "profiles" in manifest else profiles
+    for item in manifest["sources"]:
+        data_file = path.parent / item["data"]
+        yield Source(
+            name=item.get("name", str(Path(item["data"]).with_suffix(""))),
+            data_file=data_file,
+            langs=item.get("langs", langs),
+            profiles=_parse_profiles(item["profiles"]) if "profiles" in item else profiles,
+        )
+
+
+def render_source(source: Source, build_dir: Path, formats: List[str]) -> SourceResult:
+    result = SourceResult(source)
+    try:
+        out_dir = build_dir / source.name
+        variants = [(lang, profile) for lang in source.langs for profile in source.profiles]
+        resolved = get_all_data(source.data_file, [(lang, profile.render_profiles) for lang, profile in variants])
+        pages = []
+
+        for lang, profile in variants:
+            data = resolved[(lang, profile.render_profiles)]
+            translations = get_translations(lang)
+            job_title = translations.gettext(profile.job_title)
+            for fmt in formats:
+                start = perf_counter()
+                if fmt == JSONL_FORMAT:
+                    result.records.append(jsonl_record(source.name, lang, profile.name, data, job_title))
+                    result.timings.setdefault(fmt, []).append(perf_counter() - start)
+                    continue
+                if fmt == "pdf":
+                    work_dir = out_dir / "pdf" / "work" / f"{lang}_{profile.name}"
+                    artifact = RENDERERS[fmt](out_dir, data, job_title, translations, work_dir=work_dir)
+                elif fmt == "html":
+                    artifact = RENDERERS[fmt](out_dir, data, job_title, translations, profile.name)
+                    pages.append(Page(lang, profile.name, data, job_title, translations))
+                else:
+                    artifact = RENDERERS[fmt](out_dir, data, job_title, translations)
+                result.timings.setdefault(fmt, []).append(perf_counter() - start)
+                result.artifacts.append(artifact)
+
+        if pages:
+            render_site_index(out_dir, pages)
+    except Exception:
+        result.error = format_exc()
+    return result
+
+
+def render_batch(sources: Iterator[Source], build_dir: Path, formats: List[str], max_workers: int) -> Iterator[SourceResult]:
+    # At most two sources per worker are in flight, so memory does not grow with the batch size
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        pending = set()
+        for source in sources:
+            if len(pending) >= max_workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from (f.result() for f in done)
+            pending.add(pool.submit(render_source, source, build_dir, formats))
+
+        for f in pending:
+            yield f.result()
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def run_batch(
+        path: Path,
+        build_dir: Path,
+        langs: List[str],
+        profiles: List[Profile],
+        formats: List[str],
+        max_workers: int,
+) -> List[SourceResult]:
+    supported = list(RENDERERS) + [JSONL_FORMAT]
+    unsupported = [f for f in formats if f not in supported]
+    if unsupported:
+        raise Exception(f"Unsupported formats {', '.join(unsupported)}. Supported formats are {', '.join(supported)}.")
+
+    start = perf_counter()
+    results = []
+    timings = defaultdict(list)
+    build_dir.mkdir(exist_ok=True, parents=True)
+    jsonl_file = build_dir / JSONL_FILE
+    with (jsonl_file.open("w", encoding="utf-8") if JSONL_FORMAT in formats else nullcontext()) as jsonl:
+        for result in render_batch(find_sources(path, langs, profiles), build_dir, formats, max_workers):
+            if result.error:
+                print(f"{result.source.name}: failed\n{result.error}")
+            else:
+                print(f"{result.source.name}: {len(result.artifacts) + len(result.records)} artifacts")
+            for fmt, values in result.timings.items():
+                timings[fmt].extend(values)
+            if jsonl is not None and not result.error:
+                jsonl.writelines(f"{record}\n" for record in result.records)
+            results.append(SourceResult(result.source, result.artifacts, error=result.error))
+    elapsed = max(perf_counter() - start, 1e-9)
+    if JSONL_FORMAT in formats:
+        print(f"Resumes are written to {jsonl_file}")
+
+    failed = sum(1 for r in results if r.error)
+    print(f"Rendered {len(results) - failed} of {len(results)} sources in {elapsed:.2f}s, {len(results) / elapsed:.2f} items/s")
+    for fmt in formats:
+        if timings[fmt]:
+            p50 = _percentile(timings[fmt], 50) * 1000
+            p95 = _percentile(timings[fmt], 95) * 1000
+            print(f"  {fmt}: {len(timings[fmt])} variants, p50 {p50:.1f} ms, p95 {p95:.1f} ms")
+
+    return results
@@ -0,0 +1,212 @@
+import json
+import resource
+import tracemalloc
+
+from argparse import ArgumentParser
+from collections.abc import Iterable
+from dataclasses import is_dataclass, fields
+from datetime import date
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any, Set, Callable, Dict, List, Optional
+
+from oak.bench.synthetic import generate_data, generate_profiles, write_data_yaml
+from oak.html.html import render_html
+from oak.jsonresume.converter import convert
+from oak.jsonresume.jsonresume import dumps as json_dumps
+from oak.md.md import render_md
+from oak.model import (
+    ProfiledMultilangStr,
+    MultilangStr,
+    ProfiledStr,
+    Contacts,
+    SUPPORTED_LANGS,
+    resolve_all,
+    get_all_data,
+    _load_data,
+    _load_data_cached,
+    _resolve_lang_and_profiled_strings,
+)
+from oak.pdf.pdf import modern_cv_tex
+from oak.translation.translation import compile_translations, get_translations
+
+
+def _legacy_resolve(obj: Any, lang: str, profiles: Set[str]) -> Any:
+    # Per-variant isinstance walk used before the compiled resolver, kept as a baseline
+    if obj is None or isinstance(obj, (str, date, bool, int, float)):
+        return obj
+    elif isinstance(obj, Iterable):
+        return obj.__class__(filter(lambda o: o is not None, map(lambda it: _legacy_resolve(it, lang, profiles), obj)))
+    elif isinstance(obj, ProfiledMultilangStr):
+        return getattr(obj, lang) if not obj.profiles or profiles.intersection(obj.profiles) else None
+    elif isinstance(obj, MultilangStr):
+        return getattr(obj, lang)
+    elif isinstance(obj, ProfiledStr):
+        return obj.value if not obj.profiles or profiles.intersection(obj.profiles) else None
+    elif isinstance(obj, Contacts):
+        return Contacts(**{f.name: getattr(obj, f.name) for f in fields(obj) if f"exclude_{f.name}" not in profiles})
+    elif is_dataclass(obj):
+        if hasattr(obj, "profiles") and obj.profiles and not profiles.intersection(obj.profiles):
+            return None
+        return obj.__class__(**{f.name: _legacy_resolve(getattr(obj, f.name), lang, profiles) for f in fields(obj)})
+    else:
+        raise Exception(f"Unsupported class {obj.__class__}")
+
+
+def measure(fn: Callable[[], Any], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        fn()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def bench_resolve(jobs: int = 50, bullets: int = 100, profiles: int = 8):
+    data = generate_data(jobs=jobs, bullets=bullets, profiles=profiles)
+    variants = [(lang, {profile}) for lang in SUPPORTED_LANGS for profile in generate_profiles(profiles)]
+
+    resolved = resolve_all(data, variants)
+    for lang, p in variants:
+        if resolved[(lang, frozenset(p))] != _legacy_resolve(data, lang, p):
+            raise Exception(f"Resolved data mismatch for {lang} {p}")
+
+    legacy = measure(lambda: [_legacy_resolve(data, lang, p) for lang, p in variants])
+    per_variant = measure(lambda: [_resolve_lang_and_profiled_strings(data, lang, p) for lang, p in variants])
+    single_pass = measure(lambda: resolve_all(data, variants))
+
+    print(f"Resolve {len(variants)} variants of {jobs * bullets} bullets:")
+    print(f"  legacy walk per variant:    {legacy * 1000:8.1f} ms")
+    print(f"  compiled, per variant:      {per_variant * 1000:8.1f} ms ({legacy / per_variant:.1f}x)")
+    print(f"  compiled, single pass:      {single_pass * 1000:8.1f} ms ({legacy / single_pass:.1f}x)")
+
+
+def bench_memory(sources: int, jobs: int, bullets: int, technologies: int, profiles: int, langs: List[str]):
+    # Peak RSS of a batch that keeps every resolved variant of every source alive
+    variants = [(lang, {profile}) for lang in langs for profile in generate_profiles(profiles)]
+    with TemporaryDirectory() as tmp_dir:
+        files = [
+            write_data_yaml(Path(tmp_dir) / f"cv{i}.yaml", jobs=jobs, bullets=bullets, technologies=technologies, profiles=profiles, seed=i)
+            for i in range(sources)
+        ]
+        # tracemalloc adds its own bookkeeping to RSS, so peak RSS is taken from a pass without it
+        resolved = [get_all_data(f, variants) for f in files]
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        del resolved
+        _load_data_cached.cache_clear()
+
+        tracemalloc.start()
+        resolved = [get_all_data(f, variants) for f in files]
+        retained, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print(f"{len(resolved)} sources x {len(variants)} variants: peak RSS {peak / 1024:.1f} MB, {retained / 2 ** 20:.1f} MB retained")
+
+
+def bench_stages(
+        jobs: int,
+        bullets: int,
+        technologies: int,
+        profiles: int,
+        langs: List[str],
+        repeat: int = 5,
+) -> Dict[str, float]:
+    # Best time of every pipeline stage, summed over all (lang, profile) variants
+    results = {}
+    variants = [(lang, {profile}) for lang in langs for profile in generate_profiles(profiles)]
+
+    with TemporaryDirectory() as tmp_dir:
+        build_dir = Path(tmp_dir)
+        data_file = write_data_yaml(build_dir / "data.yaml", jobs=jobs, bullets=bullets, technologies=technologies, profiles=profiles)
+
+        def load():
+            _load_data_cached.cache_clear()
+            return _load_data(data_file)
+
+        results["load_data"] = measure(load, repeat)
+        data = load()
+
+        results["resolve"] = measure(lambda: [_resolve_lang_and_profiled_strings(data, lang, p) for lang, p in variants], repeat)
+        results["resolve_all"] = measure(lambda: resolve_all(data, variants), repeat)
+
+        resolved = [
+            (resolved_data, get_translations(lang), "_".join(sorted(p)))
+            for (lang, p), resolved_data in resolve_all(data, variants).items()
+        ]
+        job_title = "Software Developer"
+
+        results["render_md"] = measure(lambda: [render_md(build_dir, d, job_title, t) for d, t, _ in resolved], repeat)
+        results["render_html"] = measure(lambda: [render_html(build_dir, d, job_title, t, p) for d, t, p in resolved], repeat)
+        results["jsonresume"] = measure(lambda: [json_dumps(convert(d, job_title)) for d, _, _ in resolved], repeat)
+        results["modern_cv_tex"] = measure(lambda: [modern_cv_tex(d, job_title, t, build_dir / "cache") for d, t, _ in resolved], repeat)
+
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], max_regression: float) -> List[str]:
+    regressions = []
+    for stage, seconds in results.items():
+        if stage not in baseline:
+            continue
+        ratio = seconds / baseline[stage]
+        print(f"  {stage:20} {baseline[stage] * 1000:9.1f} ms -> {seconds * 1000:9.1f} ms ({ratio:.2f}x)")
+        if ratio > 1 + max_regression:
+            regressions.append(stage)
+    return regressions
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parser = ArgumentParser(prog="python -m oak.bench.bench")
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--bullets", type=int, default=50)
+    parser.add_argument("--technologies", type=int, default=20)
+    parser.add_argument("--profiles", type=int, default=4)
+    parser.add_argument("--langs", default=",".join(SUPPORTED_LANGS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", type=Path, default=Path("build/bench.json"))
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed slowdown against the baseline, 0.2 is 20%%")
+    parser.add_argument("--resolver", action="store_true", help="Compare the compiled resolver with the old per-variant walk")
+    parser.add_argument("--memory", type=int, metavar="SOURCES", help="Report peak RSS of resolving a batch of SOURCES generated CVs")
+    parsed = parser.parse_args(args)
+
+    if parsed.resolver:
+        bench_resolve()
+        return 0
+    if parsed.memory:
+        bench_memory(parsed.memory, parsed.jobs, parsed.bullets, parsed.technologies, parsed.profiles, parsed.langs.split(","))
+        return 0
+
+    # Output defaults to the path a baseline is usually kept at, it is read before being overwritten
+    baseline = json.loads(parsed.baseline.read_text()) if parsed.baseline else None
+    compile_translations()
+
+    params = {
+        "jobs": parsed.jobs,
+        "bullets": parsed.bullets,
+        "technologies": parsed.technologies,
+        "profiles": parsed.profiles,
+        "langs": parsed.langs.split(","),
+    }
+    results = bench_stages(repeat=parsed.repeat, **params)
+
+    parsed.output.parent.mkdir(exist_ok=True, parents=True)
+    parsed.output.write_text(json.dumps({"params": params, "results": results}, indent=4))
+    for stage, seconds in results.items():
+        print(f"  {stage:20} {seconds * 1000:9.1f} ms")
+
+    if baseline:
+        if baseline["params"] != params:
+            print(f"Baseline was measured with different params {baseline['params']}")
+        print(f"Compared with {parsed.baseline}:")
+        regressions = compare(results, baseline["results"], parsed.max_regression)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
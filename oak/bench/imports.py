@@ -0,0 +1,91 @@
+import subprocess
+import sys
+
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+# Loading the oak file must not pull in any backend, tasks import them when they run
+DEFERRED = [
+    "PIL",
+    "asyncio",
+    "brotli",
+    "fpdf",
+    "git",
+    "github",
+    "jinja2",
+    "pikepdf",
+    "requests",
+    "slugify",
+    "oak.batch",
+    "oak.github",
+    "oak.html",
+    "oak.jsonresume",
+    "oak.md",
+    "oak.pdf",
+    "oak.server",
+    "oak.watch",
+]
+
+LOAD_OAK_FILE = "from pathlib import Path; from oak_build.oak_file import OakFileLoader; OakFileLoader.load_file(Path({path!r})).unwrap()"
+
+
+def import_times(oak_file: Path) -> Tuple[Dict[str, int], Dict[str, int]]:
+    code = LOAD_OAK_FILE.format(path=str(oak_file.resolve()))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        print(result.stderr)
+        raise Exception(f"Loading {oak_file} failed with exit code {result.returncode}")
+
+    # Modules are reported after their own imports, so everything after oak_build.oak_file is loaded by the oak file
+    loaded = {}
+    top_level = {}
+    exec_started = False
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        module = name.strip()
+        if exec_started:
+            loaded[module] = int(cumulative)
+            if name.startswith(" ") and not name.startswith("  "):
+                top_level[module] = int(cumulative)
+        elif module == "oak_build.oak_file":
+            exec_started = True
+    return loaded, top_level
+
+
+def deferred_loaded(modules: List[str]) -> List[str]:
+    return [d for d in DEFERRED if any(m == d or m.startswith(d + ".") for m in modules)]
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parser = ArgumentParser(prog="python -m oak.bench.imports")
+    parser.add_argument("--oak-file", type=Path, default=Path("oak_file.py"))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-ms", type=float, default=200, help="Allowed import time of the oak file on top of oak itself")
+    parsed = parser.parse_args(args)
+
+    runs = [import_times(parsed.oak_file) for _ in range(parsed.repeat)]
+    loaded, top_level = min(runs, key=lambda run: sum(run[1].values()))
+    total_ms = sum(top_level.values()) / 1000
+
+    for module, us in sorted(top_level.items(), key=lambda item: -item[1]):
+        print(f"  {module:30} {us / 1000:9.1f} ms")
+    print(f"  {'total':30} {total_ms:9.1f} ms")
+
+    failed = False
+    deferred = deferred_loaded(list(loaded))
+    if deferred:
+        print(f"Backends imported when loading {parsed.oak_file}: {', '.join(deferred)}")
+        failed = True
+    if total_ms > parsed.max_ms:
+        print(f"Loading {parsed.oak_file} took {total_ms:.1f} ms, budget is {parsed.max_ms:.1f} ms")
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    exit(main())
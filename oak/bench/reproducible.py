@@ -0,0 +1,111 @@
+import os
+import subprocess
+import sys
+
+from argparse import ArgumentParser
+from hashlib import sha256
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Dict, List, Optional
+
+from oak.bench.synthetic import generate_profiles, write_data_yaml
+from oak.html.html import Page, render_site
+from oak.jsonresume.jsonresume import render_json
+from oak.md.md import render_md
+from oak.model import SUPPORTED_LANGS, get_all_data
+from oak.pdf.compiler import open_compiler
+from oak.pdf.optimize import optimize_pdf
+from oak.pdf.pdf import render_modern_cv_all
+from oak.pdf.preview import render_preview_cv
+from oak.profile import Profile
+from oak.translation.translation import compile_translations, get_translations
+
+
+FORMATS = ["md", "jsonresume", "html", "pdf-preview", "pdf"]
+DEFAULT_FORMATS = ["md", "jsonresume", "html", "pdf-preview"]
+# Build caches and intermediate files are not outputs
+SKIPPED_DIRS = {"cache", "work", "fmt"}
+
+
+def render_all(build_dir: Path, formats: List[str], profiles: int, compiler_name: str, optimize: bool):
+    data_file = write_data_yaml(build_dir / "data.yaml", jobs=10, bullets=20, technologies=10, profiles=profiles)
+    variants = [(lang, Profile(p, p.replace("_", " ").title(), frozenset([p]))) for lang in SUPPORTED_LANGS for p in generate_profiles(profiles)]
+    resolved = get_all_data(data_file, [(lang, profile.render_profiles) for lang, profile in variants], build_dir / "cache")
+    jobs = []
+    for lang, profile in variants:
+        translations = get_translations(lang)
+        jobs.append((lang, profile, resolved[(lang, profile.render_profiles)], translations.gettext(profile.job_title), translations))
+
+    # Every format gets its own build dir, pdf and pdf-preview write the same file names
+    if "md" in formats:
+        for _, _, data, job_title, translations in jobs:
+            render_md(build_dir / "md", data, job_title, translations)
+    if "jsonresume" in formats:
+        for _, _, data, job_title, translations in jobs:
+            render_json(build_dir / "jsonresume", data, job_title, translations)
+    if "html" in formats:
+        render_site(build_dir / "html", [Page(lang, profile.name, data, job_title, translations) for lang, profile, data, job_title, translations in jobs])
+    if "pdf-preview" in formats:
+        for _, _, data, job_title, translations in jobs:
+            pdf = render_preview_cv(build_dir / "pdf-preview", data, job_title, translations)
+            if optimize:
+                optimize_pdf(pdf)
+    if "pdf" in formats:
+        with open_compiler(compiler_name, build_dir) as compiler:
+            render_modern_cv_all(build_dir / "pdf", [job[2:] for job in jobs], compiler=compiler, optimize=optimize)
+
+
+def tree_hashes(root: Path) -> Dict[str, str]:
+    hashes = {}
+    for path in sorted(root.rglob("*")):
+        relative = path.relative_to(root)
+        if path.is_file() and not SKIPPED_DIRS.intersection(relative.parts):
+            hashes[relative.as_posix()] = sha256(path.read_bytes()).hexdigest()
+    return hashes
+
+
+def build(build_dir: Path, hash_seed: str, render_args: List[str]):
+    # Separate interpreters with different hash seeds catch set and dict ordering leaking into outputs
+    env = {**os.environ, "PYTHONHASHSEED": hash_seed}
+    subprocess.run([sys.executable, "-m", "oak.bench.reproducible", "--render", str(build_dir)] + render_args, env=env, check=True)
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parser = ArgumentParser(prog="python -m oak.bench.reproducible")
+    parser.add_argument("--formats", default=",".join(DEFAULT_FORMATS), help=f"Comma separated, supported formats are {', '.join(FORMATS)}")
+    parser.add_argument("--profiles", type=int, default=2)
+    parser.add_argument("--pdf-compiler", default="docker")
+    parser.add_argument("--optimize", action="store_true", help="Post-process PDFs as OAK_PDF_OPTIMIZE=1 does")
+    parser.add_argument("--render", type=Path, help="Render into the directory instead of comparing two builds")
+    parsed = parser.parse_args(args)
+
+    formats = parsed.formats.split(",")
+    unsupported = [f for f in formats if f not in FORMATS]
+    if unsupported:
+        raise Exception(f"Unsupported formats {', '.join(unsupported)}. Supported formats are {', '.join(FORMATS)}.")
+
+    if parsed.render:
+        compile_translations()
+        render_all(parsed.render, formats, parsed.profiles, parsed.pdf_compiler, parsed.optimize)
+        return 0
+
+    render_args = ["--formats", parsed.formats, "--profiles", str(parsed.profiles), "--pdf-compiler", parsed.pdf_compiler]
+    if parsed.optimize:
+        render_args.append("--optimize")
+
+    with TemporaryDirectory() as first_dir, TemporaryDirectory() as second_dir:
+        build(Path(first_dir), "1", render_args)
+        build(Path(second_dir), "2", render_args)
+        first = tree_hashes(Path(first_dir))
+        second = tree_hashes(Path(second_dir))
+
+    different = sorted(name for name in first.keys() | second.keys() if first.get(name) != second.get(name))
+    print(f"Built {len(first)} files twice, {len(different)} differ")
+    for name in different:
+        print(f"  {name}")
+
+    return 1 if different or not first else 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,70 @@
+from datetime import date
+from pathlib import Path
+from random import Random
+from typing import List, Dict, Any
+
+from yaml import safe_dump
+
+from oak.model import Data, SUPPORTED_LANGS, _data_schema
+
+
+def _multilang(text: str) -> Dict[str, str]:
+    return {lang: f"{text} ({lang})" for lang in SUPPORTED_LANGS}
+
+
+def generate_profiles(profiles: int = 4) -> List[str]:
+    return [f"profile_{i}" for i in range(profiles)]
+
+
+def generate_data_dict(jobs: int = 20, bullets: int = 100, technologies: int = 20, profiles: int = 4, seed: int = 0) -> Dict[str, Any]:
+    rnd = Random(seed)
+    profile_names = generate_profiles(profiles)
+
+    def some_profiles() -> List[str]:
+        return rnd.sample(profile_names, rnd.randint(0, min(2, profiles)))
+
+    work_experience = []
+    for j in range(jobs):
+        work_experience.append({
+            "organisation": {"name": _multilang(f"Organisation {j}"), "url": f"https://org{j}.example.com"},
+            "position": _multilang(f"Position {j}"),
+            "summary": _multilang(f"Summary of job {j}"),
+            "from_date": date(2000 + j, 1, 1).isoformat(),
+            "to_date": date(2001 + j, 1, 1).isoformat(),
+            "bullets": [
+                {**_multilang(f"Achievement {j}.{b} " + "lorem ipsum " * rnd.randint(1, 8)), "profiles": some_profiles()}
+                for b in range(bullets)
+            ],
+            "technologies": [
+                {"value": f"Technology {t}", "profiles": some_profiles()} if rnd.random() < 0.5 else f"Technology {t}"
+                for t in range(technologies)
+            ],
+            "profiles": some_profiles() if rnd.random() < 0.2 else [],
+        })
+
+    return {
+        "personal": {"name": _multilang("Name"), "surname": _multilang("Surname")},
+        "contacts": {"phone": "+0-000-000-00-00", "email": "name@example.com", "github": "name", "site": "https://example.com"},
+        "about_me": {"text_parts": [{**_multilang(f"About me {i}"), "profiles": some_profiles()} for i in range(10)]},
+        "education": [
+            {
+                "university": _multilang(f"University {e}"),
+                "faculty": _multilang(f"Faculty {e}"),
+                "speciality": _multilang(f"Speciality {e}"),
+                "degree": _multilang(f"Degree {e}"),
+                "from_date": date(1990 + e, 9, 1).isoformat(),
+                "to_date": date(1994 + e, 6, 30).isoformat(),
+            }
+            for e in range(2)
+        ],
+        "work_experience": work_experience,
+    }
+
+
+def generate_data(**kwargs) -> Data:
+    return _data_schema().load(generate_data_dict(**kwargs))
+
+
+def write_data_yaml(path: Path, **kwargs) -> Path:
+    path.write_text(safe_dump(generate_data_dict(**kwargs), allow_unicode=True, sort_keys=False))
+    return path
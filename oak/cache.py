@@ -0,0 +1,71 @@
+from gettext import GNUTranslations
+from hashlib import sha256
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from oak.model import Data
+from oak.reproducible import source_date_epoch
+
+
+SOURCES = [Path(__file__)]
+from oak.translation.translation import catalog_hash
+
+
+def write_if_changed(path: Path, text: str) -> Path:
+    # Keep mtime of unchanged outputs stable so downstream publishing can skip them
+    content = text.encode()
+    if not path.exists() or path.read_bytes() != content:
+        path.write_bytes(content)
+    return path
+
+
+def sources_hash(sources: List[Path]) -> str:
+    h = sha256()
+    for source in sources:
+        h.update(source.read_bytes())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class BuildCache:
+    def __init__(self, cache_dir: Path):
+        self.artifacts_dir = cache_dir / "artifacts"
+
+    def key(self, renderer: str, sources: List[Path], data: Data, job_title: str, translations: GNUTranslations) -> str:
+        # PDFs embed SOURCE_DATE_EPOCH as their dates, a new epoch must not return an artifact with the old one
+        h = sha256()
+        for part in [renderer, sources_hash(sources), repr(data), job_title, catalog_hash(translations), str(source_date_epoch())]:
+            h.update(part.encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[Path]:
+        entry = self.artifacts_dir / key
+        if not entry.exists():
+            return None
+
+        path, mtime_ns = entry.read_text().splitlines()
+        artifact = Path(path)
+        if not artifact.exists() or artifact.stat().st_mtime_ns != int(mtime_ns):
+            return None
+        return artifact
+
+    def put(self, key: str, artifact: Path):
+        self.artifacts_dir.mkdir(exist_ok=True, parents=True)
+        (self.artifacts_dir / key).write_text(f"{artifact}\n{artifact.stat().st_mtime_ns}\n")
+
+    def render(
+            self,
+            renderer: str,
+            sources: List[Path],
+            data: Data,
+            job_title: str,
+            translations: GNUTranslations,
+            render: Callable[[], Path],
+    ) -> Path:
+        key = self.key(renderer, sources, data, job_title, translations)
+        artifact = self.get(key)
+        if artifact is None:
+            artifact = render()
+            self.put(key, artifact)
+        return artifact
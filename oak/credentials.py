@@ -0,0 +1,13 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class GitUserInfo:
+    name: str
+    email: str
+
+
+@dataclass
+class GithubUserCredentials:
+    user: str
+    token: str
@@ -1,29 +1,133 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from gettext import GNUTranslations
 from pathlib import Path
-from shutil import copy
-
-from jinja2 import Environment
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
 
+from oak.html.assets import ImageSet, INLINE_CSS_LIMIT, minify_css, minify_html, remove_stale, write_asset, write_image_set, write_output
+from oak.cache import BuildCache, SOURCES as CACHE_SOURCES
 from oak.model import Data
+from oak.templates import get_environment, SOURCES as TEMPLATES_SOURCES
+from oak.trace import span, traced
 
 
 RESOURCES_DIR = Path("./oak/html/resources")
+STYLESHEET = "style.css"
+HEADSHOT = "sulim.jpg"
+# Headshot is shown at 100 CSS px, variants cover 1x to 3x screens
+HEADSHOT_WIDTHS = [100, 200, 300]
+ASSETS = [STYLESHEET, HEADSHOT]
+ASSETS_DIR = "assets"
+SITE_DIR = "site"
+SOURCES = [Path(__file__), Path(__file__).parent / "assets.py", RESOURCES_DIR / "index.html"] + [RESOURCES_DIR / f for f in ASSETS] + TEMPLATES_SOURCES + CACHE_SOURCES
+
+_ASSETS: Dict[Path, Tuple[Tuple[int, ...], "Assets"]] = {}
+_ASSETS_LOCK = Lock()
+
+
+@dataclass(frozen=True)
+class Assets:
+    inline_css: Optional[str]
+    stylesheet: Optional[str]
+    headshot: ImageSet
+
+
+@dataclass(frozen=True)
+class Page:
+    lang: str
+    profile: str
+    data: Data
+    job_title: str
+    translations: GNUTranslations
+
+
+def prepare_assets(assets_dir: Path) -> Assets:
+    # Assets are processed once per directory and reused by every page until a source changes
+    mtimes = tuple((RESOURCES_DIR / f).stat().st_mtime_ns for f in ASSETS)
+    with _ASSETS_LOCK:
+        cached = _ASSETS.get(assets_dir)
+        if cached and cached[0] == mtimes and (assets_dir / cached[1].headshot.src).exists():
+            return cached[1]
+
+        assets_dir.mkdir(exist_ok=True, parents=True)
+        css = minify_css((RESOURCES_DIR / STYLESHEET).read_text(encoding="utf-8"))
+        inline_css = css if len(css.encode()) <= INLINE_CSS_LIMIT else None
+        assets = Assets(
+            inline_css=inline_css,
+            stylesheet=None if inline_css else write_asset(assets_dir, STYLESHEET, css.encode()),
+            headshot=write_image_set(assets_dir, RESOURCES_DIR / HEADSHOT, HEADSHOT_WIDTHS),
+        )
+        remove_stale(assets_dir, {assets.stylesheet} | {name for _, name in assets.headshot.variants})
+        _ASSETS[assets_dir] = (mtimes, assets)
+        return assets
+
+
+def _relative_url(target: Path, page_dir: Path) -> str:
+    return Path(os.path.relpath(target, page_dir)).as_posix()
+
+
+def render_page(
+        page_dir: Path,
+        assets_dir: Path,
+        data: Data,
+        job_title: str,
+        translations: GNUTranslations,
+        cache_dir: Path,
+        assets_url: Optional[str] = None,
+) -> Path:
+    # Assets are linked relative to the page unless they are served from a fixed url
+    assets = prepare_assets(assets_dir)
+    env = get_environment(RESOURCES_DIR, translations, cache_dir)
+
+    with span("jinja", template="index.html", lang=translations.info()["language"]):
+        template = env.get_template("index.html")
+        rendered = template.render(data=data, job_title=job_title, assets=assets, assets_url=assets_url or _relative_url(assets_dir, page_dir))
+
+    page_dir.mkdir(exist_ok=True, parents=True)
+    return write_output(page_dir / "index.html", minify_html(rendered).encode())
+
+
+@traced
+def render_html(build_dir: Path, data: Data, job_title: str, translations: GNUTranslations, profile: str) -> Path:
+    # Same layout as render_site, every profile gets its own page next to the shared assets
+    site_dir = build_dir / SITE_DIR
+    page_dir = site_dir / translations.info()["language"] / profile
+    render_page(page_dir, site_dir / ASSETS_DIR, data, job_title, translations, build_dir / "cache")
+    return page_dir
+
 
+@traced
+def render_site_index(build_dir: Path, pages: List[Page]) -> Path:
+    if not pages:
+        raise Exception("Site index needs at least one page")
+    site_dir = build_dir / SITE_DIR
+    assets = prepare_assets(site_dir / ASSETS_DIR)
 
-def render_html(build_dir: Path, data: Data, job_title: str, translations: GNUTranslations) -> Path:
-    env = Environment(extensions=['jinja2.ext.i18n'])
-    env.install_gettext_translations(translations)
+    with span("jinja", template="site_index.html"):
+        env = get_environment(RESOURCES_DIR, pages[0].translations, build_dir / "cache")
+        rendered = env.get_template("site_index.html").render(pages=pages, assets=assets)
+    return write_output(site_dir / "index.html", minify_html(rendered).encode())
 
-    template = env.from_string((RESOURCES_DIR / "index.html").read_text())
-    rendered = template.render(data=data, job_title=job_title)
 
-    html_dir = build_dir / "html" / translations.info()["language"]
-    html_dir.mkdir(exist_ok=True, parents=True)
+@traced
+def render_site(build_dir: Path, pages: List[Page], max_workers: Optional[int] = None, cache: Optional[BuildCache] = None) -> Path:
+    # Every page links the same assets directory, so site size grows with pages only
+    prepare_assets(build_dir / SITE_DIR / ASSETS_DIR)
 
-    for f in ["style.css", "sulim.jpg"]:
-        copy(RESOURCES_DIR / f, html_dir / f)
+    def render(page: Page) -> Path:
+        with span("page", lang=page.lang, profile=page.profile, format="html"):
+            render_one = lambda: render_html(build_dir, page.data, page.job_title, page.translations, page.profile) / "index.html"
+            if cache:
+                return cache.render(f"html_{page.profile}", SOURCES, page.data, page.job_title, page.translations, render_one)
+            return render_one()
 
-    html_rendered = html_dir / "index.html"
-    html_rendered.write_text(rendered)
+    # Brotli and gzip release the GIL, so precompressing changed pages runs in parallel
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for _ in pool.map(render, pages):
+            pass
 
-    return html_dir
+    if pages:
+        render_site_index(build_dir, pages)
+    return build_dir / SITE_DIR
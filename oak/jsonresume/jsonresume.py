@@ -1,46 +1,100 @@
+import json
+
+from dataclasses import fields, is_dataclass
+from datetime import date
 from gettext import GNUTranslations
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Union, get_args, get_origin, get_type_hints
 
-from marshmallow import Schema, post_dump
-from marshmallow_dataclass import class_schema
-
+from oak.cache import write_if_changed, SOURCES as CACHE_SOURCES
 from oak.jsonresume.converter import convert
 from oak.jsonresume.model import JsonResume
 from oak.model import Data
+from oak.trace import span, traced
+
+
+SOURCES = [
+    Path(__file__),
+    Path(__file__).parent / "converter.py",
+    Path(__file__).parent / "model.py",
+] + CACHE_SOURCES
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+def _compile_value_encoder(tp: Any) -> Callable[[Any], Any]:
+    origin = get_origin(tp)
+    if origin is Union:
+        args = [a for a in get_args(tp) if a is not type(None)]
+        return _compile_value_encoder(args[0])
+    elif origin in (list, List):
+        item_encoder = _compile_value_encoder(get_args(tp)[0])
+        if item_encoder is _identity:
+            return list
+        return lambda value: [item_encoder(it) for it in value]
+    elif tp is date:
+        return date.isoformat
+    elif is_dataclass(tp):
+        return lambda value: _encoder(tp)(value)
+    else:
+        return _identity
+
+
+def _compile_encoder(cls: type) -> Callable[[Any], Dict[str, Any]]:
+    # Same output as an ordered marshmallow schema that drops None values
+    hints = get_type_hints(cls)
+    encoders = [(f.name, _compile_value_encoder(hints[f.name])) for f in fields(cls)]
+
+    def encode(obj: Any) -> Dict[str, Any]:
+        result = {}
+        for name, encoder in encoders:
+            value = getattr(obj, name)
+            if value is not None:
+                result[name] = encoder(value)
+        return result
+
+    return encode
+
+
+_ENCODERS: Dict[type, Callable[[Any], Dict[str, Any]]] = {}
 
 
-class BaseSchema(Schema):
-    class Meta:
-        ordered=True
+def _encoder(cls: type) -> Callable[[Any], Dict[str, Any]]:
+    encoder = _ENCODERS.get(cls)
+    if encoder is None:
+        encoder = _ENCODERS[cls] = _compile_encoder(cls)
+    return encoder
 
-    SKIP_VALUES = [
-        lambda v: v is None,
-    ]
 
-    @post_dump
-    def remove_skip_values(self, data, **kwargs):
-        return {
-            key: value for key, value in data.items()
-            if not any([predicate(value) for predicate in self.SKIP_VALUES])
-        }
+def encode(json_resume: JsonResume) -> Dict[str, Any]:
+    return _encoder(JsonResume)(json_resume)
 
 
-JsonResumeSchema = class_schema(JsonResume, BaseSchema)
+def dumps(json_resume: JsonResume) -> str:
+    return json.dumps(encode(json_resume), indent=4)
 
 
-def remove_skip_values(self, data):
-    return {
-        key: value for key, value in data.items()
-        if value is not None
+def jsonl_record(source: str, lang: str, profile: str, data: Data, job_title: str) -> str:
+    record = {
+        "source": source,
+        "lang": lang,
+        "profile": profile,
+        "resume": encode(convert(data, job_title)),
     }
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
 
 
+@traced
 def render_json(build_dir: Path, data: Data, job_title: str, translations: GNUTranslations) -> Path:
     _ = translations.gettext
     lang = translations.info()["language"]
 
-    json_resume = convert(data, job_title)
-    text = JsonResumeSchema().dumps(json_resume, indent=4)
+    with span("convert", lang=lang):
+        json_resume = convert(data, job_title)
+    with span("dumps", lang=lang):
+        text = dumps(json_resume)
 
     out_dir = build_dir / "jsonresume"
     out_dir.mkdir(exist_ok=True, parents=True)
@@ -48,6 +102,6 @@ def render_json(build_dir: Path, data: Data, job_title: str, translations: GNUTr
     cv_suffix = _("CV")
     job_title = job_title.replace(" ", "_")
     json_rendered = out_dir / f"{data.personal.name}_{data.personal.surname}_{job_title}_{cv_suffix}.json"
-    json_rendered.write_text(text)
+    write_if_changed(json_rendered, text)
 
     return json_rendered
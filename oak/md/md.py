@@ -1,26 +1,33 @@
 from gettext import GNUTranslations
+from pathlib import Path
 
-from jinja2 import Environment
+from ..model import Data
+from ..cache import write_if_changed, SOURCES as CACHE_SOURCES
+from ..templates import get_environment, SOURCES as TEMPLATES_SOURCES
+from ..trace import span, traced
 
-from ..model import *
 
+RESOURCES_DIR = Path("./oak/md/resources")
+TEMPLATE = RESOURCES_DIR / "template.md"
+SOURCES = [Path(__file__), TEMPLATE] + TEMPLATES_SOURCES + CACHE_SOURCES
 
+
+@traced
 def render_md(build_dir: Path, data: Data, job_title: str, translations: GNUTranslations) -> Path:
     _ = translations.gettext
     lang = translations.info()["language"]
 
-    env = Environment(extensions=['jinja2.ext.i18n'])
-    env.install_gettext_translations(translations, newstyle=True)
-    env.policies["ext.i18n.trimmed"] = True
+    env = get_environment(RESOURCES_DIR, translations, build_dir / "cache", newstyle=True, trimmed=True)
 
-    template = env.from_string(Path("./oak/md/resources/template.md").read_text())
-    rendered = template.render(data=data, job_title=job_title, lang=lang)
+    with span("jinja", template=TEMPLATE.name, lang=lang):
+        template = env.get_template(TEMPLATE.name)
+        rendered = template.render(data=data, job_title=job_title, lang=lang)
 
     out_dir = build_dir / "md"
     out_dir.mkdir(exist_ok=True, parents=True)
     cv_suffix = _("CV")
     job_title = job_title.replace(" ", "_")
     md_rendered = out_dir / f"{data.personal.name}_{data.personal.surname}_{job_title}_{cv_suffix}.md"
-    md_rendered.write_text(rendered)
+    write_if_changed(md_rendered, rendered)
 
     return md_rendered
@@ -1,37 +1,50 @@
-from dataclasses import dataclass, field, is_dataclass
+import pickle
+import sys
+
+from dataclasses import dataclass, field, fields, is_dataclass
 from datetime import date
+from functools import lru_cache
+from hashlib import sha256
 from pathlib import Path
-from typing import List, Optional, Union, Any, Set
+from tempfile import NamedTemporaryFile
+from typing import List, Optional, Union, Any, Set, Tuple, FrozenSet, Dict, Callable, Sequence
 from collections.abc import Iterable
 
-from yaml import load as load_yaml, SafeLoader
+from yaml import load as load_yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 from marshmallow_dataclass import class_schema
 
+from oak.trace import span
+
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class MultilangStr:
     ru: str
     en: str
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ProfiledMultilangStr(MultilangStr):
     profiles: Optional[List[str]] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ProfiledStr:
     value: str
     profiles: Optional[List[str]] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Personal:
     name: Union[str, MultilangStr]
     surname: Union[str, MultilangStr]
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Contacts:
     phone: Optional[str] = None
     email: Optional[str] = None
@@ -41,12 +54,12 @@ class Contacts:
     skype: Optional[str] = None
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class AboutMe:
     text_parts: List[Union[str, ProfiledMultilangStr]]
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Education:
     university: Union[str, MultilangStr]
     faculty: Union[str, MultilangStr]
@@ -56,13 +69,13 @@ class Education:
     to_date: Optional[date] = None
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Organisation:
     name: Union[str, MultilangStr]
     url: Optional[str] = None
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class WorkExperience:
     organisation: Organisation
     position: Union[str, MultilangStr]
@@ -75,7 +88,7 @@ class WorkExperience:
     profiles: Optional[List[str]] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Data:
     personal: Personal = None
     contacts: Optional[Contacts] = None
@@ -89,61 +102,249 @@ SUPPORTED_LANGS = [
     "en",
 ]
 
-def _load_data(file: Path) -> Data:
-    data_dict = load_yaml(file.read_text(), Loader=SafeLoader)
-    return class_schema(Data)().load(data_dict)
 
+@lru_cache(maxsize=None)
+def _data_schema():
+    return class_schema(Data)()
+
+
+@lru_cache(maxsize=None)
+def _schema_hash() -> str:
+    return sha256(Path(__file__).read_bytes()).hexdigest()
+
+
+def _intern(obj: Any) -> Any:
+    # Repeated names, technologies and profile tags end up as one string object
+    if isinstance(obj, str):
+        return sys.intern(obj)
+    elif isinstance(obj, dict):
+        return {_intern(k): _intern(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_intern(it) for it in obj]
+    return obj
+
+
+def _parse_data(text: bytes) -> Data:
+    data_dict = load_yaml(text, Loader=SafeLoader)
+    return _data_schema().load(_intern(data_dict))
+
+
+def _load_snapshot(file: Path, text: bytes, cache_dir: Path) -> Data:
+    # Snapshots are named by source, so a new one only replaces older snapshots of the same file
+    source = sha256(str(file).encode()).hexdigest()[:16]
+    key = sha256(text + _schema_hash().encode()).hexdigest()
+    snapshot = cache_dir / f"data-{source}-{key}.pickle"
+    try:
+        return pickle.loads(snapshot.read_bytes())
+    except (OSError, pickle.UnpicklingError, AttributeError, EOFError):
+        pass
+
+    data = _parse_data(text)
+    cache_dir.mkdir(exist_ok=True, parents=True)
+    for stale in cache_dir.glob(f"data-{source}-*.pickle"):
+        if stale != snapshot:
+            stale.unlink(missing_ok=True)
+    with NamedTemporaryFile(dir=cache_dir, prefix=f"data-{source}-", suffix=".tmp", delete=False) as tmp:
+        tmp.write(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+    Path(tmp.name).replace(snapshot)
+    return data
 
-def _is_simple_type(obj: Any) -> bool:
-    return obj is None or isinstance(obj, (str, date, bool, int, float))
 
+@lru_cache(maxsize=16)
+def _load_data_cached(file: Path, mtime_ns: int, size: int, cache_dir: Optional[Path]) -> Data:
+    text = file.read_bytes()
+    if cache_dir is None:
+        return _parse_data(text)
+    return _load_snapshot(file, text, cache_dir)
 
-def _resolve_lang_and_profiled_strings(obj: Any, lang: str, profiles: Set[str]) -> Any:
-    if _is_simple_type(obj):
-        return obj
-    elif isinstance(obj, Iterable):
-        return obj.__class__(filter(lambda o: o is not None, map(lambda it: _resolve_lang_and_profiled_strings(it, lang, profiles), obj)))
-    elif isinstance(obj, ProfiledMultilangStr):
-        if not obj.profiles or profiles.intersection(obj.profiles):
-            return getattr(obj, lang)
-        else:
-            return None
-    elif isinstance(obj, MultilangStr):
-        return getattr(obj, lang)
-    elif isinstance(obj, ProfiledStr):
-        if not obj.profiles or profiles.intersection(obj.profiles):
-            return obj.value
-        else:
-            return None
-    elif isinstance(obj, Contacts):
-        return _contacts_preprocessor(obj, profiles)
-    elif is_dataclass(obj):
-        if hasattr(obj, "profiles"):
-            if not obj.profiles or profiles.intersection(obj.profiles):
-                pass
-            else:
-                return None
-
-        args = {}
-        for k, v in obj.__dict__.items():
-            args[k] = _resolve_lang_and_profiled_strings(v, lang, profiles)
-        return obj.__class__(**args)
+
+def _load_data(file: Path, cache_dir: Optional[Path] = None) -> Data:
+    # Loaded document is shared between variants, resolving never mutates it
+    stat = file.stat()
+    return _load_data_cached(file.resolve(), stat.st_mtime_ns, stat.st_size, cache_dir)
+
+
+SIMPLE_TYPES = (type(None), str, date, bool, int, float)
+
+Variant = Tuple[str, FrozenSet[str]]
+
+
+class _Variants:
+    def __init__(self, variants: List[Variant]):
+        self.langs = [lang for lang, _ in variants]
+        self.all = [True] * len(variants)
+
+        known_profiles = sorted(set().union(*(profiles for _, profiles in variants)))
+        self.bits = {profile: 1 << i for i, profile in enumerate(known_profiles)}
+        self.masks = [self.mask(profiles) for _, profiles in variants]
+        # Documents reuse a few profile lists, each of them is matched once
+        self.matches: Dict[Tuple[str, ...], List[bool]] = {}
+        self.present_langs: Dict[Tuple[str, ...], List[Optional[str]]] = {}
+        self.excluded = [
+            {p.removeprefix("exclude_") for p in profiles if p.startswith("exclude_")}
+            for _, profiles in variants
+        ]
+
+    def mask(self, profiles: Iterable[str]) -> int:
+        mask = 0
+        for profile in profiles:
+            mask |= self.bits.get(profile, 0)
+        return mask
+
+    def match(self, profiles: Optional[List[str]]) -> List[bool]:
+        if not profiles:
+            return self.all
+        key = tuple(profiles)
+        present = self.matches.get(key)
+        if present is None:
+            mask = self.mask(profiles)
+            present = self.matches[key] = [bool(mask & m) for m in self.masks]
+        return present
+
+    def langs_of(self, profiles: Optional[List[str]]) -> List[Optional[str]]:
+        # Language of every variant keeping a string with these profiles, None for variants dropping it
+        if not profiles:
+            return self.langs
+        key = tuple(profiles)
+        langs = self.present_langs.get(key)
+        if langs is None:
+            langs = self.present_langs[key] = [lang if present else None for lang, present in zip(self.langs, self.match(profiles))]
+        return langs
+
+
+def _resolve_simple(obj: Any, variants: _Variants) -> List[Any]:
+    return [obj] * len(variants.langs)
+
+
+def _share(obj: Any, original_ids: Tuple[int, ...], row: Sequence, shared: Dict[Tuple, Any], build: Callable[[], Any]) -> Any:
+    # Variants resolving to the same children get one instance, unchanged subtrees stay the loaded objects
+    key = tuple(map(id, row))
+    value = shared.get(key)
+    if value is None:
+        value = shared[key] = obj if key == original_ids else build()
+    return value
+
+
+def _resolve_iterable(obj: Any, variants: _Variants) -> List[Any]:
+    # Items of a list mostly share a class, looking resolvers up inline saves a call per item
+    resolvers = _RESOLVERS
+    columns = [(resolvers.get(it.__class__) or _resolver(it.__class__))(it, variants) for it in obj]
+    if not columns:
+        return [obj] * len(variants.langs)
+
+    original_ids = tuple(map(id, obj))
+    shared = {}
+    result = []
+    for row in zip(*columns):
+        items = [it for it in row if it is not None]
+        result.append(_share(obj, original_ids, items, shared, lambda: obj.__class__(items)))
+    return result
+
+
+def _resolve_profiled_multilang_str(obj: ProfiledMultilangStr, variants: _Variants) -> List[Any]:
+    return [getattr(obj, lang) if lang else None for lang in variants.langs_of(obj.profiles)]
+
+
+def _resolve_multilang_str(obj: MultilangStr, variants: _Variants) -> List[Any]:
+    return [getattr(obj, lang) for lang in variants.langs]
+
+
+def _resolve_profiled_str(obj: ProfiledStr, variants: _Variants) -> List[Any]:
+    return [obj.value if present else None for present in variants.match(obj.profiles)]
+
+
+def _resolve_contacts(obj: Contacts, variants: _Variants) -> List[Any]:
+    names = [f.name for f in fields(Contacts)]
+    shared = {}
+    result = []
+    for excluded in variants.excluded:
+        key = frozenset(excluded.intersection(names))
+        if key not in shared:
+            shared[key] = Contacts(**{k: getattr(obj, k) for k in names if k not in key}) if key else obj
+        result.append(shared[key])
+    return result
+
+
+def _compile_dataclass_resolver(cls: type) -> Callable[[Any, _Variants], List[Any]]:
+    names = [f.name for f in fields(cls)]
+    profiled = "profiles" in names
+
+    def resolve(obj: Any, variants: _Variants) -> List[Any]:
+        present = variants.match(obj.profiles) if profiled else variants.all
+        original = [getattr(obj, name) for name in names]
+        original_ids = tuple(map(id, original))
+        columns = [_resolve(value, variants) for value in original]
+        shared = {}
+        return [
+            _share(obj, original_ids, row, shared, lambda: cls(*row)) if keep else None
+            for keep, row in zip(present, zip(*columns))
+        ]
+
+    return resolve
+
+
+def _compile_resolver(cls: type) -> Callable[[Any, _Variants], List[Any]]:
+    if issubclass(cls, SIMPLE_TYPES):
+        return _resolve_simple
+    elif issubclass(cls, Iterable):
+        return _resolve_iterable
+    elif issubclass(cls, ProfiledMultilangStr):
+        return _resolve_profiled_multilang_str
+    elif issubclass(cls, MultilangStr):
+        return _resolve_multilang_str
+    elif issubclass(cls, ProfiledStr):
+        return _resolve_profiled_str
+    elif issubclass(cls, Contacts):
+        return _resolve_contacts
+    elif is_dataclass(cls):
+        return _compile_dataclass_resolver(cls)
     else:
-        raise Exception(f"Unsupported class {obj.__class__}")
+        raise Exception(f"Unsupported class {cls}")
+
+
+_RESOLVERS: Dict[type, Callable[[Any, _Variants], List[Any]]] = {}
+
 
+def _resolver(cls: type) -> Callable[[Any, _Variants], List[Any]]:
+    resolver = _RESOLVERS.get(cls)
+    if resolver is None:
+        resolver = _RESOLVERS[cls] = _compile_resolver(cls)
+    return resolver
 
-def _contacts_preprocessor(contacts: Contacts, profiles: Set[str]) -> Contacts:
-    args = {}
-    for contact_type, value in contacts.__dict__.items():
-        if not f"exclude_{contact_type}" in profiles:
-            args[contact_type] = value
-    return Contacts(**args)
 
+def _resolve(obj: Any, variants: _Variants) -> List[Any]:
+    return (_RESOLVERS.get(obj.__class__) or _resolver(obj.__class__))(obj, variants)
 
-def get_data(file: Path, lang: str, profiles: Set[str]) -> Data:
+
+def _check_lang(lang: str):
     if lang not in SUPPORTED_LANGS:
         raise Exception(f"Unsupported language {lang}. Supported languages are {', '.join(SUPPORTED_LANGS)}.")
 
-    data = _load_data(file)
-    preprocessed_data = _resolve_lang_and_profiled_strings(data, lang, profiles)
+
+def resolve_all(data: Data, variants: Iterable[Tuple[str, Set[str]]]) -> Dict[Variant, Data]:
+    keys = list(dict.fromkeys((lang, frozenset(profiles)) for lang, profiles in variants))
+    for lang, _ in keys:
+        _check_lang(lang)
+
+    return dict(zip(keys, _resolve(data, _Variants(keys))))
+
+
+def _resolve_lang_and_profiled_strings(obj: Any, lang: str, profiles: Set[str]) -> Any:
+    return _resolve(obj, _Variants([(lang, frozenset(profiles))]))[0]
+
+
+def get_data(file: Path, lang: str, profiles: Set[str], cache_dir: Optional[Path] = None) -> Data:
+    _check_lang(lang)
+
+    with span("load_data", file=file):
+        data = _load_data(file, cache_dir)
+    with span("resolve", lang=lang, profiles=",".join(sorted(profiles))):
+        preprocessed_data = _resolve_lang_and_profiled_strings(data, lang, profiles)
     return preprocessed_data
+
+
+def get_all_data(file: Path, variants: Iterable[Tuple[str, Set[str]]], cache_dir: Optional[Path] = None) -> Dict[Variant, Data]:
+    with span("load_data", file=file):
+        data = _load_data(file, cache_dir)
+    with span("resolve_all"):
+        return resolve_all(data, variants)
@@ -0,0 +1,159 @@
+import os
+import subprocess
+
+from contextlib import contextmanager
+from hashlib import sha256
+from pathlib import Path
+from shutil import which, copy
+from threading import Lock
+from time import perf_counter
+from typing import List, Iterator, Dict, Tuple
+
+from oak.reproducible import reproducible_env, SOURCES as REPRODUCIBLE_SOURCES
+
+
+SOURCES = [Path(__file__)] + REPRODUCIBLE_SOURCES
+TEXLIVE_IMAGE = "thomasweise/docker-texlive-full"
+PDFLATEX = "/usr/bin/pdflatex"
+
+# Everything before this marker is dumped into the preamble format, it is a no-op without the format
+ENDOFDUMP = r"\csname endofdump\endcsname"
+
+
+def compile_env() -> Dict[str, str]:
+    return {**os.environ, **reproducible_env()}
+
+
+def _docker_env_flags() -> List[str]:
+    # Variables are passed by name, docker takes their values from compile_env
+    return [flag for name in reproducible_env() for flag in ("-e", name)]
+
+
+class Compiler:
+    def command(self, work_dir: Path) -> List[str]:
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class DockerCompiler(Compiler):
+    # Fresh container for every compile
+    def command(self, work_dir: Path) -> List[str]:
+        return ["docker", "run", "-i", "--rm", "--user", f"{os.getuid()}:{os.getgid()}", "-v", f"{work_dir}:{work_dir}",
+                "-w", f"{work_dir}"] + _docker_env_flags() + [TEXLIVE_IMAGE, PDFLATEX]
+
+
+class LocalCompiler(Compiler):
+    def __init__(self):
+        self.pdflatex = which("pdflatex")
+        if self.pdflatex is None:
+            raise Exception("pdflatex is not found in PATH")
+
+    def command(self, work_dir: Path) -> List[str]:
+        return [self.pdflatex]
+
+
+class PersistentDockerCompiler(Compiler):
+    # One container for the whole build, jobs are submitted with docker exec
+    def __init__(self, mount_dir: Path):
+        mount_dir.mkdir(exist_ok=True, parents=True)
+        self.container = subprocess.check_output(
+            ["docker", "run", "-d", "--rm", "--user", f"{os.getuid()}:{os.getgid()}", "-v", f"{mount_dir}:{mount_dir}",
+             "--entrypoint", "sleep", TEXLIVE_IMAGE, "infinity"],
+            text=True,
+        ).strip()
+        try:
+            self.health_check()
+        except Exception:
+            self.close()
+            raise
+
+    def health_check(self):
+        subprocess.run(["docker", "exec", self.container, PDFLATEX, "--version"], check=True, capture_output=True)
+
+    def command(self, work_dir: Path) -> List[str]:
+        return ["docker", "exec", "-i", "-w", f"{work_dir}"] + _docker_env_flags() + [self.container, PDFLATEX]
+
+    def close(self):
+        subprocess.run(["docker", "rm", "-f", self.container], capture_output=True)
+
+
+class PreambleFormats:
+    # Preambles dumped with mylatexformat once per build, keyed by preamble contents
+    def __init__(self, fmt_dir: Path, compiler: Compiler):
+        self.fmt_dir = fmt_dir
+        self.compiler = compiler
+        self.lock = Lock()
+        self.formats: Dict[str, Path] = {}
+
+    def get(self, tex_file: Path) -> Tuple[str, Path]:
+        preamble = tex_file.read_text().split(ENDOFDUMP)[0]
+        key = f"preamble-{sha256(preamble.encode()).hexdigest()[:16]}"
+        with self.lock:
+            if key not in self.formats:
+                self.formats[key] = self._dump(key, preamble)
+        return key, self.formats[key]
+
+    def link(self, tex_file: Path, work_dir: Path) -> str:
+        key, fmt = self.get(tex_file)
+        target = work_dir / fmt.name
+        target.unlink(missing_ok=True)
+        try:
+            os.link(fmt, target)
+        except OSError:
+            copy(fmt, target)
+        return key
+
+    def _dump(self, key: str, preamble: str) -> Path:
+        fmt = self.fmt_dir / f"{key}.fmt"
+        if fmt.exists():
+            return fmt
+
+        self.fmt_dir.mkdir(exist_ok=True, parents=True)
+        (self.fmt_dir / f"{key}.tex").write_text(f"{preamble}{ENDOFDUMP}\n")
+
+        start = perf_counter()
+        subprocess.run(
+            self.compiler.command(self.fmt_dir) + ["-ini", f"-jobname={key}", "&pdflatex", "mylatexformat.ltx", f"{key}.tex"],
+            cwd=self.fmt_dir,
+            env=compile_env(),
+            check=True,
+            capture_output=True,
+        )
+        print(f"Dumped preamble format {fmt.name} in {perf_counter() - start:.2f}s")
+
+        return fmt
+
+
+COMPILERS = [
+    "docker",
+    "docker-persistent",
+    "local",
+]
+
+
+def _create_compiler(name: str, mount_dir: Path) -> Compiler:
+    if name == "docker":
+        return DockerCompiler()
+    elif name == "docker-persistent":
+        return PersistentDockerCompiler(mount_dir)
+    else:
+        return LocalCompiler()
+
+
+@contextmanager
+def open_compiler(name: str, mount_dir: Path) -> Iterator[Compiler]:
+    if name not in COMPILERS:
+        raise Exception(f"Unsupported compiler {name}. Supported compilers are {', '.join(COMPILERS)}.")
+
+    try:
+        compiler = _create_compiler(name, mount_dir)
+    except Exception as e:
+        print(f"Compiler {name} is not available ({e}), falling back to docker")
+        compiler = DockerCompiler()
+
+    try:
+        yield compiler
+    finally:
+        compiler.close()
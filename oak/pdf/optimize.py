@@ -0,0 +1,82 @@
+import json
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import List, Optional
+
+import pikepdf
+
+from oak.trace import span
+
+
+SOURCES = [Path(__file__)]
+SIZE_REPORT = "sizes.json"
+
+_REPORT_LOCK = Lock()
+
+# Subset fonts are named with a six letter tag, e.g. ABCDEF+LMRoman10-Regular
+_SUBSET_TAG = re.compile(r"^/?[A-Z]{6}\+")
+
+
+@dataclass(frozen=True)
+class OptimizeResult:
+    path: Path
+    before: int
+    after: int
+    full_fonts: List[str]
+
+
+def _font_descriptor(font: pikepdf.Dictionary) -> Optional[pikepdf.Dictionary]:
+    if font.get("/Subtype") == "/Type0":
+        font = font.DescendantFonts[0]
+    return font.get("/FontDescriptor")
+
+
+def full_fonts(pdf: pikepdf.Pdf) -> List[str]:
+    names = set()
+    for page in pdf.pages:
+        fonts = page.Resources.get("/Font", {})
+        for _, font in fonts.items():
+            descriptor = _font_descriptor(font)
+            if descriptor is None or not any(key in descriptor for key in ("/FontFile", "/FontFile2", "/FontFile3")):
+                continue
+            name = str(font.get("/BaseFont", ""))
+            if not _SUBSET_TAG.match(name):
+                names.add(name.lstrip("/"))
+    return sorted(names)
+
+
+def optimize_pdf(path: Path) -> OptimizeResult:
+    # pdflatex and fpdf2 already embed font subsets, fully embedded fonts are reported so the template can be fixed
+    before = path.stat().st_size
+    with span("optimize_pdf", file=path.name):
+        with pikepdf.open(path, allow_overwriting_input=True) as pdf:
+            fonts = full_fonts(pdf)
+            pdf.remove_unreferenced_resources()
+            pdf.save(
+                path,
+                compress_streams=True,
+                recompress_flate=True,
+                object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                linearize=True,
+                deterministic_id=True,
+            )
+
+    result = OptimizeResult(path, before, path.stat().st_size, fonts)
+    print(f"{path.name}: {result.before / 1024:.1f} KiB -> {result.after / 1024:.1f} KiB{', full fonts: ' + ', '.join(fonts) if fonts else ''}")
+    return result
+
+
+def record_size(report: Path, result: OptimizeResult):
+    # Report keeps the last optimization of every artifact, cached artifacts keep their entries
+    with _REPORT_LOCK:
+        sizes = json.loads(report.read_text()) if report.exists() else {}
+        sizes[result.path.name] = {"before": result.before, "after": result.after, "full_fonts": result.full_fonts}
+        report.write_text(json.dumps(sizes, indent=4, ensure_ascii=False, sort_keys=True))
+
+
+def check_size_budget(pdfs: List[Path], budget: int):
+    over = [f"{pdf.name} ({pdf.stat().st_size / 1024:.1f} KiB)" for pdf in pdfs if pdf.stat().st_size > budget]
+    if over:
+        raise Exception(f"PDF size budget of {budget / 1024:.1f} KiB is exceeded by {', '.join(over)}")
@@ -1,203 +1,180 @@
 import datetime
-import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from gettext import GNUTranslations
 from pathlib import Path
-from typing import Optional
-
-from pylatex import Document, Section, Subsection, Package
-from pylatex.base_classes import Command, Environment
-from pylatex.basic import HugeText, NewLine, LargeText
-from pylatex.utils import italic, bold, escape_latex, NoEscape
-from pylatex.lists import Itemize
+from shutil import move
+from time import perf_counter
+from typing import Optional, List, Tuple
 
+from oak.cache import BuildCache, SOURCES as CACHE_SOURCES
 from oak.model import Data
+from oak.pdf.compiler import Compiler, DockerCompiler, PreambleFormats, ENDOFDUMP, compile_env, SOURCES as COMPILER_SOURCES
+from oak.templates import get_environment, SOURCES as TEMPLATES_SOURCES
+from oak.trace import span, traced
+
+
+RESOURCES_DIR = Path(__file__).parent / "resources"
+TEMPLATE = "moderncv.j2"
+SOURCES = [Path(__file__), RESOURCES_DIR / TEMPLATE] + COMPILER_SOURCES + TEMPLATES_SOURCES + CACHE_SOURCES
+
+# Same replacements as pylatex escape_latex, so the emitted tex is unchanged
+_LATEX_SPECIAL_CHARS = str.maketrans({
+    "&": r"\&",
+    "%": r"\%",
+    "$": r"\$",
+    "#": r"\#",
+    "_": r"\_",
+    "{": r"\{",
+    "}": r"\}",
+    "~": r"\textasciitilde{}",
+    "^": r"\^{}",
+    "\\": r"\textbackslash{}",
+    "\n": "\\newline%\n",
+    "-": r"{-}",
+    "\xa0": "~",
+    "[": r"{[}",
+    "]": r"{]}",
+})
+
+
+def _print_interval(translations: GNUTranslations, from_date: datetime.date, to_date: Optional[datetime.date]) -> str:
+    _ = translations.gettext
 
+    year_from = from_date.year
+    month_from = _(from_date.strftime("%B"))
+
+    if to_date:
+        year_to = to_date.year
+        month_to = _(to_date.strftime("%B"))
+
+        return f"{month_from} {year_from} - {month_to} {year_to}"
+    else:
+        current = _("current")
+        return f"{month_from} {year_from} - {current}"
 
-def render_pdf(build_dir: Path, data: Data, job_title: str, translations: GNUTranslations, debug: bool = False) -> Path:
-    _ = translations.gettext
 
-    doc = Document(
-        'basic',
-        fontenc=["T2A", "T1"],
+def escape_latex(value) -> str:
+    return str(value).translate(_LATEX_SPECIAL_CHARS)
+
+
+@traced
+def modern_cv_tex(data: Data, job_title: str, translations: GNUTranslations, cache_dir: Optional[Path] = None, endofdump: bool = False) -> str:
+    env = get_environment(RESOURCES_DIR, translations, cache_dir, latex=True)
+    env.filters["latex"] = escape_latex
+    return env.get_template(TEMPLATE).render(
+        data=data,
+        job_title=job_title,
+        endofdump=ENDOFDUMP if endofdump else None,
+        interval=partial(_print_interval, translations),
     )
-    doc.packages.add(Package("babel", options=["main=russian", "english"]))
-    doc.packages.add(Package("cmap"))
-    doc.packages.add(Package("hyperref"))
-    doc.packages.add(Package("erewhon"))
-
-    doc.append(HugeText(bold(f"{data.personal.name} {data.personal.surname}")))
-    doc.append(NewLine())
-    doc.append(LargeText(job_title))
-    doc.append(NewLine())
-    doc.append(NewLine())
-
-    if data.contacts.email:
-        doc.append(_("Email: "))
-        doc.append(Command("href", [f"mailto:{data.contacts.email}", f"{data.contacts.email}"]))
-        doc.append(NewLine())
-
-    if data.contacts.phone:
-        doc.append(_("Phone: {phone}").format(phone=data.contacts.phone))
-        doc.append(NewLine())
-
-    if data.contacts.telegram:
-        doc.append(f"Telegram: ")
-        doc.append(Command("href", [f"https://t.me/{data.contacts.telegram}", f"{data.contacts.telegram}"]))
-        doc.append(NewLine())
-
-    if data.contacts.site:
-        doc.append(f"Site: ")
-        doc.append(Command("href", [f"{data.contacts.site}", f"{data.contacts.site}"]))
-        doc.append(NewLine())
-
-    if data.contacts.github:
-        doc.append(f"Github: ")
-        doc.append(Command("href", [f"https://github.com/{data.contacts.github}", f"{data.contacts.github}"]))
-        doc.append(NewLine())
-
-    with doc.create(Section(_("Work experience"), numbering=False)):
-        for job in reversed(data.work_experience):
-            with doc.create(Subsection(_("{position} at {organization_name}").format(position=job.position, organization_name=job.organisation.name), numbering=False)):
-                doc.append(italic(_("{from_date} - Present").format(from_date=job.from_date) if job.current else _("{from_date} - {to_date}").format(from_date=job.from_date, to_date=job.to_date)))
-
-                bullets = Itemize()
-                for bullet in job.bullets:
-                    bullets.add_item(f"{bullet}".strip("\n"))
-                doc.append(bullets)
-
-                if job.technologies:
-                    doc.append(_("Key skills: "))
-                    doc.append(italic(escape_latex(", ".join(job.technologies))))
-
-    if data.education:
-        with doc.create(Section(_("Education"), numbering=False)):
-            for education in reversed(data.education):
-                with doc.create(Subsection(f"{education.university} - {education.faculty}", numbering=False)):
-                    doc.append(italic(f"{education.from_date} - {education.to_date}"))
-                    doc.append(NewLine())
-                    doc.append(f"{education.degree} {education.speciality}")
 
-    out_dir = build_dir / "pdf"
-    out_dir.mkdir(exist_ok=True, parents=True)
-    cv_suffix = _("CV")
-    job_title = job_title.replace(" ", "_")
-    out_file = out_dir / f"{data.personal.name}_{data.personal.surname}_{job_title}_{cv_suffix}.pdf"
 
-    command = ["docker", "run", "-i", "--rm", "--user", f"{os.getuid()}:{os.getgid()}", "-v", f"{out_dir}:{out_dir}",
-               "-w", f"{out_dir}", "thomasweise/docker-texlive-full", "/usr/bin/pdflatex"]
+def render_modern_cv(
+        build_dir: Path,
+        data: Data,
+        job_title: str,
+        translations: GNUTranslations,
+        debug: bool = False,
+        work_dir: Optional[Path] = None,
+        compiler: Optional[Compiler] = None,
+        formats: Optional[PreambleFormats] = None,
+        optimize: bool = False,
+) -> Path:
+    with span("render_modern_cv", lang=translations.info()["language"], job_title=job_title, format="pdf"):
+        tex = modern_cv_tex(data, job_title, translations, build_dir / "cache", endofdump=formats is not None)
 
-    doc.generate_pdf(str(out_file)[:-4], clean=not debug, clean_tex=not debug, compiler=command[0], compiler_args=command[1:])
+        out_file = _out_file(build_dir, data, job_title, translations)
+        _generate_pdf(tex, out_file, work_dir or out_file.parent, compiler or DockerCompiler(), clean=not debug, clean_tex=False, formats=formats, optimize=optimize)
 
     return out_file
 
 
-def render_modern_cv(build_dir: Path, data: Data, job_title: str, translations: GNUTranslations, debug: bool = False) -> Path:
+def render_modern_cv_all(
+        build_dir: Path,
+        jobs: List[Tuple[Data, str, GNUTranslations]],
+        max_workers: Optional[int] = None,
+        debug: bool = False,
+        compiler: Optional[Compiler] = None,
+        precompile_preamble: bool = False,
+        cache: Optional[BuildCache] = None,
+        optimize: bool = False,
+) -> List[Path]:
+    # Every job compiles in its own directory so parallel pdflatex runs do not share aux files
+    work_root = build_dir / "pdf" / "work"
+    compiler = compiler or DockerCompiler()
+    formats = PreambleFormats(build_dir / "pdf" / "fmt", compiler) if precompile_preamble else None
+    renderer, sources = "pdf", SOURCES
+    if optimize:
+        # pikepdf is only loaded when the optional post-processing is enabled
+        from oak.pdf.optimize import SOURCES as OPTIMIZE_SOURCES
+
+        renderer, sources = "pdf-optimized", SOURCES + OPTIMIZE_SOURCES
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = []
+        for i, (data, job_title, translations) in enumerate(jobs):
+            render = partial(render_modern_cv, build_dir, data, job_title, translations, debug, work_root / str(i), compiler, formats, optimize)
+            if cache:
+                futures.append(pool.submit(cache.render, renderer, sources, data, job_title, translations, render))
+            else:
+                futures.append(pool.submit(render))
+        return [f.result() for f in futures]
+
+
+def _out_file(build_dir: Path, data: Data, job_title: str, translations: GNUTranslations) -> Path:
     _ = translations.gettext
-    lang = translations.info()["language"]
-
-    doc = Document(
-        'basic',
-        documentclass="moderncv",
-        document_options=["11pt", "a4paper", "roman"],
-        fontenc=["T2A", "T1"],
-    )
-    doc.packages.add(Package("babel", options=["main=russian", "english"]))
-    doc.packages.add(Package("inputenc", options=["utf8"]))
-    doc.packages.add(Package("cmap"))
-    doc.packages.add(Package("erewhon"))
-    doc.packages.add(Package("geometry", options=["scale=0.85"]))
-
-    doc.preamble.append(Command("moderncvstyle", "banking"))
-    doc.preamble.append(Command("moderncvcolor", "burgundy"))
-
-    doc.preamble.append(Command("name", [
-        Command("mbox", data.personal.name),
-        Command("mbox", data.personal.surname),
-    ]))
-    doc.preamble.append(Command("title", Command("mbox", job_title)))
-    if data.contacts.phone:
-        doc.preamble.append(Command("phone", data.contacts.phone, options=["mobile"]))
-    if data.contacts.email:
-        doc.preamble.append(Command("email", data.contacts.email))
-    if data.contacts.site:
-        site = data.contacts.site.removeprefix("http://").removeprefix("https://")
-        doc.preamble.append(Command("homepage", site))
-    if data.contacts.github:
-        doc.preamble.append(Command("social", data.contacts.github, options="github"))
-
-    if data.about_me:
-        about = " ".join([s.strip(" \n") for s in data.about_me.text_parts])
-        doc.preamble.append(Command("quote", about))
-
-    doc.append(Command("makecvtitle"))
-
-    def print_interval(from_date: datetime.date, to_date: Optional[datetime.date]) -> str:
-        year_from = from_date.year
-        month_from = _(from_date.strftime("%B"))
-
-        if to_date:
-            year_to = to_date.year
-            month_to = _(to_date.strftime("%B"))
-
-            return f"{month_from} {year_from} - {month_to} {year_to}"
-        else:
-            current = _("current")
-            return f"{month_from} {year_from} - {current}"
-
-    with doc.create(Section(_("Experience"), label="Experience")):
-        for job in reversed(data.work_experience):
-            # \cventry{year--year}{Job title}{Employer}{City}{}{General description no longer than 1--2 lines.\newline{}%
-            doc.append(Command("cventry", [
-                print_interval(job.from_date, job.to_date),
-                job.position,
-                Command("parbox", ["11cm", job.organisation.name]),
-                "",
-                "",
-                "",
-            ]))
-
-            if job.summary:
-                doc.append(escape_latex(job.summary.strip("\n")))
-                doc.append(NewLine())
-
-            doc.append(Command("medskip"))
-            doc.append(_("Main achievements:"))
-            bullets = Itemize()
-            for bullet in job.bullets:
-                bullets.add_item(bullet.strip("\n"))
-            doc.append(bullets)
-
-            if job.technologies:
-                doc.append(Command("medskip"))
-                doc.append(_("Key skills: "))
-                doc.append(italic(escape_latex(", ".join(job.technologies))))
-                doc.append(NewLine())
-                doc.append(NewLine())
-
-            doc.append(Command("bigskip"))
-
-    if data.education:
-        with doc.create(Section(_("Education"), label="Education")):
-            for education in reversed(data.education):
-                # \cventry{year--year}{Degree}{Institution}{City}{\textit{Grade}}{Description}
-                doc.append(Command("cventry", [
-                    NoEscape(f"{education.from_date.year}--{education.to_date.year}"),
-                    education.degree,
-                    Command("parbox", ["12cm", f"{education.university} {education.faculty}"]),
-                    "",
-                    "",
-                    NoEscape("\\smallskip"),
-                ]))
 
     out_dir = build_dir / "pdf"
     out_dir.mkdir(exist_ok=True, parents=True)
     cv_suffix = _("CV")
     job_title = job_title.replace(" ", "_")
-    out_file = out_dir / f"{data.personal.name}_{data.personal.surname}_{job_title}_{cv_suffix}.pdf"
-
-    command = ["docker", "run", "-i", "--rm", "--user", f"{os.getuid()}:{os.getgid()}", "-v", f"{out_dir}:{out_dir}",
-               "-w", f"{out_dir}", "thomasweise/docker-texlive-full", "/usr/bin/pdflatex"]
-
-    doc.generate_pdf(str(out_file)[:-4], clean=not debug, clean_tex=False, compiler=command[0], compiler_args=command[1:])
-
-    return out_file
+    return out_dir / f"{data.personal.name}_{data.personal.surname}_{job_title}_{cv_suffix}.pdf"
+
+
+@traced
+def _generate_pdf(
+        tex: str,
+        out_file: Path,
+        work_dir: Path,
+        compiler: Compiler,
+        clean: bool,
+        clean_tex: bool,
+        formats: Optional[PreambleFormats] = None,
+        optimize: bool = False,
+):
+    work_dir.mkdir(exist_ok=True, parents=True)
+    filepath = work_dir.resolve() / out_file.stem
+    tex_file = filepath.with_suffix(".tex")
+    tex_file.write_text(tex, encoding="utf-8")
+
+    command = compiler.command(work_dir)
+    if formats:
+        fmt = formats.link(tex_file, work_dir)
+        command.append(f"-fmt={fmt}")
+
+    start = perf_counter()
+    result = subprocess.run(command + ["--interaction=nonstopmode", str(tex_file)], cwd=work_dir, env=compile_env(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    if result.returncode != 0:
+        print(result.stdout.decode(errors="replace"))
+        raise Exception(f"{command[0]} failed to compile {tex_file.name} with exit code {result.returncode}")
+    if formats:
+        print(f"{out_file.name}: compiled in {perf_counter() - start:.2f}s with preamble format {fmt}")
+
+    if clean:
+        for ext in ["aux", "log", "out", "fls", "fdb_latexmk"]:
+            filepath.with_suffix(f".{ext}").unlink(missing_ok=True)
+    if clean_tex:
+        tex_file.unlink()
+
+    if optimize:
+        from oak.pdf.optimize import SIZE_REPORT, optimize_pdf, record_size
+
+        record_size(out_file.parent / SIZE_REPORT, optimize_pdf(filepath.with_suffix(".pdf")))
+
+    if work_dir != out_file.parent:
+        compiled = work_dir / out_file.name
+        if out_file.exists() and out_file.read_bytes() == compiled.read_bytes():
+            compiled.unlink()
+        else:
+            move(compiled, out_file)
@@ -0,0 +1,124 @@
+import os
+from gettext import GNUTranslations
+from pathlib import Path
+from typing import Optional
+
+from fpdf import FPDF
+
+from oak.model import Data
+from oak.pdf.pdf import _out_file, _print_interval
+from oak.reproducible import source_date, SOURCES as REPRODUCIBLE_SOURCES
+from oak.trace import traced
+
+
+SOURCES = [Path(__file__), Path(__file__).parent / "pdf.py"] + REPRODUCIBLE_SOURCES
+
+# Fast preview needs a Unicode TrueType font with Cyrillic, OAK_PREVIEW_FONT_DIR takes precedence
+PREVIEW_FONT_DIRS = [
+    Path("/usr/share/fonts/truetype/dejavu"),
+    Path("/usr/share/fonts/dejavu"),
+    Path("/usr/share/fonts/TTF"),
+    Path("/usr/local/share/fonts"),
+    Path("/Library/Fonts"),
+]
+PREVIEW_FONT = "DejaVuSans.ttf"
+PREVIEW_BOLD_FONT = "DejaVuSans-Bold.ttf"
+PREVIEW_COLOR = (139, 0, 1)
+
+
+def _preview_font_dir() -> Path:
+    dirs = [Path(os.environ["OAK_PREVIEW_FONT_DIR"])] if "OAK_PREVIEW_FONT_DIR" in os.environ else PREVIEW_FONT_DIRS
+    for font_dir in dirs:
+        if (font_dir / PREVIEW_FONT).exists() and (font_dir / PREVIEW_BOLD_FONT).exists():
+            return font_dir
+    raise Exception(f"{PREVIEW_FONT} and {PREVIEW_BOLD_FONT} are not found, set OAK_PREVIEW_FONT_DIR")
+
+
+@traced
+def render_preview_cv(build_dir: Path, data: Data, job_title: str, translations: GNUTranslations) -> Path:
+    # Same sections as render_modern_cv laid out directly with fpdf, for drafts only
+    _ = translations.gettext
+
+    font_dir = _preview_font_dir()
+    pdf = FPDF(format="A4")
+    # Creation date also seeds the document /ID
+    pdf.set_creation_date(source_date())
+    pdf.set_margins(18, 15, 18)
+    pdf.set_auto_page_break(True, margin=15)
+    pdf.add_font("cv", "", str(font_dir / PREVIEW_FONT))
+    pdf.add_font("cv", "B", str(font_dir / PREVIEW_BOLD_FONT))
+    pdf.add_page()
+
+    date_width = 42
+    text_width = pdf.epw - date_width
+
+    def text(value: str, size: float = 10, style: str = "", color=(0, 0, 0), x: Optional[float] = None, width: float = 0, height: float = 5):
+        pdf.set_font("cv", style, size)
+        pdf.set_text_color(*color)
+        if x is not None:
+            pdf.set_x(x)
+        pdf.multi_cell(width, height, value, align="L", new_x="LMARGIN", new_y="NEXT")
+
+    def section(title: str):
+        pdf.ln(4)
+        y = pdf.get_y() + 3
+        pdf.set_draw_color(*PREVIEW_COLOR)
+        pdf.set_line_width(1.5)
+        pdf.line(pdf.l_margin, y, pdf.l_margin + date_width - 3, y)
+        text(title, size=14, color=PREVIEW_COLOR, x=pdf.l_margin + date_width, height=6)
+        pdf.ln(2)
+
+    def entry(interval: str, title: str, subtitle: str):
+        y = pdf.get_y()
+        text(interval, size=9, color=(90, 90, 90), width=date_width - 3)
+        pdf.set_y(y)
+        text(title, style="B", x=pdf.l_margin + date_width, width=text_width)
+        text(subtitle, color=(90, 90, 90), x=pdf.l_margin + date_width, width=text_width)
+
+    text(f"{data.personal.name} {data.personal.surname}", size=26, style="B", color=PREVIEW_COLOR, height=11)
+    text(job_title, size=14, color=(90, 90, 90), height=7)
+
+    contacts = []
+    if data.contacts.phone:
+        contacts.append(data.contacts.phone)
+    if data.contacts.email:
+        contacts.append(data.contacts.email)
+    if data.contacts.site:
+        contacts.append(data.contacts.site.removeprefix("http://").removeprefix("https://"))
+    if data.contacts.github:
+        contacts.append(f"github.com/{data.contacts.github}")
+    if contacts:
+        text("  |  ".join(contacts), size=9, color=(90, 90, 90))
+
+    if data.about_me:
+        pdf.ln(4)
+        about = " ".join([s.strip(" \n") for s in data.about_me.text_parts])
+        text(about, size=10, color=(60, 60, 60), x=pdf.l_margin + 10, width=pdf.epw - 20)
+
+    section(_("Experience"))
+    for job in reversed(data.work_experience):
+        entry(_print_interval(translations, job.from_date, job.to_date), job.position, job.organisation.name)
+
+        if job.summary:
+            text(job.summary.strip("\n"), x=pdf.l_margin + date_width, width=text_width)
+
+        pdf.ln(1)
+        text(_("Main achievements:"), x=pdf.l_margin + date_width, width=text_width)
+        for bullet in job.bullets:
+            text(f"\u2022 {bullet.strip()}", x=pdf.l_margin + date_width + 3, width=text_width - 3)
+
+        if job.technologies:
+            pdf.ln(1)
+            text(_("Key skills: ") + ", ".join(job.technologies), size=9, color=(60, 60, 60), x=pdf.l_margin + date_width, width=text_width)
+        pdf.ln(4)
+
+    if data.education:
+        section(_("Education"))
+        for education in reversed(data.education):
+            entry(f"{education.from_date.year}--{education.to_date.year}", education.degree, f"{education.university} {education.faculty}")
+            pdf.ln(2)
+
+    out_file = _out_file(build_dir, data, job_title, translations)
+    pdf.output(str(out_file))
+
+    return out_file
@@ -0,0 +1,9 @@
+from dataclasses import dataclass
+from typing import FrozenSet
+
+
+@dataclass(eq=True, frozen=True)
+class Profile:
+    name: str
+    job_title: str
+    render_profiles: FrozenSet[str]
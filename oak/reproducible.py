@@ -0,0 +1,33 @@
+import os
+import subprocess
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict
+
+
+REPO_DIR = Path(__file__).parent.parent
+SOURCES = [Path(__file__)]
+# Outputs depend on the CV data and the code rendering it, commits touching anything else keep the dates
+INPUTS = ["data.yaml", "oak_file.py", "oak"]
+
+
+@lru_cache
+def source_date_epoch() -> int:
+    # SOURCE_DATE_EPOCH from reproducible-builds.org, by default the last commit changing the inputs
+    if "SOURCE_DATE_EPOCH" in os.environ:
+        return int(os.environ["SOURCE_DATE_EPOCH"])
+    result = subprocess.run(["git", "log", "-1", "--format=%ct", "--"] + INPUTS, cwd=REPO_DIR, capture_output=True, text=True)
+    return int(result.stdout.strip()) if result.returncode == 0 and result.stdout.strip() else 0
+
+
+def source_date() -> datetime:
+    return datetime.fromtimestamp(source_date_epoch(), timezone.utc)
+
+
+def reproducible_env() -> Dict[str, str]:
+    # pdfTeX takes document dates from SOURCE_DATE_EPOCH, FORCE_SOURCE_DATE extends it to \today and \time
+    return {
+        "SOURCE_DATE_EPOCH": str(source_date_epoch()),
+        "FORCE_SOURCE_DATE": "1",
+    }
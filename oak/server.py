@@ -0,0 +1,315 @@
+import asyncio
+import json
+import mimetypes
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from gettext import GNUTranslations
+from pathlib import Path
+from threading import Lock
+from time import perf_counter
+from traceback import print_exc
+from typing import Dict, List, Optional, Tuple, Callable
+from urllib.parse import urlsplit, parse_qs
+
+from oak.cache import BuildCache
+from oak.html.html import prepare_assets, render_page, SOURCES as HTML_SOURCES
+from oak.jsonresume.jsonresume import render_json, SOURCES as JSON_SOURCES
+from oak.md.md import render_md, SOURCES as MD_SOURCES
+from oak.model import Data, get_data, _data_schema
+from oak.pdf.compiler import Compiler, open_compiler
+from oak.pdf.pdf import render_modern_cv, SOURCES as PDF_SOURCES
+from oak.pdf.preview import render_preview_cv, SOURCES as PREVIEW_SOURCES
+from oak.profile import Profile
+from oak.translation.translation import get_translations
+
+
+DEFAULT_SOURCE = "data.yaml"
+# Rendered pages link assets from here, every variant shares one fingerprinted assets directory
+ASSETS_PATH = "/assets"
+
+_REASONS = {
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+}
+
+Renderer = Callable[[Path, Data, str, GNUTranslations], Path]
+
+
+@dataclass(frozen=True)
+class Format:
+    sources: List[Path]
+    content_type: str
+    render: Renderer
+
+
+@dataclass(frozen=True)
+class Output:
+    key: str
+    content: bytes
+    content_type: str
+
+
+class RequestError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class OutputCache:
+    # Only touched from the event loop thread
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[str, Output] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Output]:
+        output = self.entries.get(key)
+        if output is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return output
+
+    def put(self, output: Output):
+        if len(output.content) > self.max_bytes or output.key in self.entries:
+            return
+        self.entries[output.key] = output
+        self.size += len(output.content)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted.content)
+
+
+class RenderService:
+    def __init__(
+            self,
+            root: Path,
+            build_dir: Path,
+            langs: List[str],
+            profiles: List[Profile],
+            max_workers: int,
+            cache_bytes: int,
+            compiler: Optional[Compiler] = None,
+    ):
+        self.root = root.resolve()
+        self.build_dir = build_dir
+        self.cache_dir = build_dir / "cache"
+        self.assets_dir = build_dir / "assets"
+        self.langs = langs
+        self.profiles = {p.name: p for p in profiles}
+        # md, html and json render in Python and share the GIL, more workers only overlap pdf compiler runs
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.outputs = OutputCache(cache_bytes)
+        self.keys = BuildCache(self.cache_dir)
+        self.inflight: Dict[str, asyncio.Task] = {}
+        self.dir_locks: Dict[Path, Lock] = {}
+        self.dir_locks_lock = Lock()
+        self.formats = {
+            "md": Format(MD_SOURCES, "text/markdown; charset=utf-8", render_md),
+            "html": Format(HTML_SOURCES, "text/html; charset=utf-8", lambda out_dir, *args: render_page(
+                out_dir, self.assets_dir, *args, self.cache_dir, ASSETS_PATH)),
+            "json": Format(JSON_SOURCES, "application/json", render_json),
+            "pdf": Format(PDF_SOURCES, "application/pdf", lambda out_dir, *args: render_modern_cv(
+                out_dir, *args, work_dir=out_dir / "pdf" / "work", compiler=compiler)),
+            "pdf-preview": Format(PREVIEW_SOURCES, "application/pdf", render_preview_cv),
+        }
+
+    def warm(self):
+        _data_schema()
+        prepare_assets(self.assets_dir)
+        for lang in self.langs:
+            get_translations(lang)
+        default_source = self.root / DEFAULT_SOURCE
+        if default_source.exists():
+            for lang in self.langs:
+                for profile in self.profiles.values():
+                    get_data(default_source, lang, profile.render_profiles, self.cache_dir)
+
+    def close(self):
+        self.pool.shutdown()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self.outputs.entries),
+            "bytes": self.outputs.size,
+            "hits": self.outputs.hits,
+            "misses": self.outputs.misses,
+            "inflight": len(self.inflight),
+        }
+
+    def _data_file(self, source: str) -> Path:
+        data_file = (self.root / source).resolve()
+        if not data_file.is_relative_to(self.root) or data_file.suffix != ".yaml":
+            raise RequestError(400, f"Source {source} must be a yaml file inside {self.root}")
+        if not data_file.exists():
+            raise RequestError(404, f"Source {source} is not found")
+        return data_file
+
+    def _dir_lock(self, out_dir: Path) -> Lock:
+        with self.dir_locks_lock:
+            return self.dir_locks.setdefault(out_dir, Lock())
+
+    def _prepare(self, data_file: Path, lang: str, profile: Profile, fmt: str) -> Tuple[str, Data, str, GNUTranslations]:
+        translations = get_translations(lang)
+        job_title = translations.gettext(profile.job_title)
+        data = get_data(data_file, lang, profile.render_profiles, self.cache_dir)
+        key = self.keys.key(fmt, self.formats[fmt].sources, data, job_title, translations)
+        return key, data, job_title, translations
+
+    def _render(self, out_dir: Path, fmt: str, data: Data, job_title: str, translations: GNUTranslations) -> bytes:
+        # Variant directories are reused between requests, so jinja bytecode and pdf work dirs stay warm
+        with self._dir_lock(out_dir):
+            return self.formats[fmt].render(out_dir, data, job_title, translations).read_bytes()
+
+    async def _render_and_store(self, key: str, out_dir: Path, fmt: str, data: Data, job_title: str, translations: GNUTranslations) -> Output:
+        loop = asyncio.get_running_loop()
+        content = await loop.run_in_executor(self.pool, self._render, out_dir, fmt, data, job_title, translations)
+        output = Output(key, content, self.formats[fmt].content_type)
+        self.outputs.put(output)
+        return output
+
+    async def render(self, source: str, lang: Optional[str], profile_name: Optional[str], fmt: str) -> Output:
+        if lang not in self.langs:
+            raise RequestError(400, f"Unsupported lang {lang}. Supported langs are {', '.join(self.langs)}.")
+        if profile_name not in self.profiles:
+            raise RequestError(400, f"Unknown profile {profile_name}. Known profiles are {', '.join(self.profiles)}.")
+        if fmt not in self.formats:
+            raise RequestError(400, f"Unsupported format {fmt}. Supported formats are {', '.join(self.formats)}.")
+        data_file = self._data_file(source)
+        profile = self.profiles[profile_name]
+
+        loop = asyncio.get_running_loop()
+        key, data, job_title, translations = await loop.run_in_executor(self.pool, self._prepare, data_file, lang, profile, fmt)
+        output = self.outputs.get(key)
+        if output is not None:
+            return output
+
+        # Concurrent requests for the same content share one render
+        task = self.inflight.get(key)
+        if task is None:
+            out_dir = self.build_dir / "out" / data_file.relative_to(self.root).with_suffix("") / f"{lang}_{profile.name}" / fmt
+            task = asyncio.ensure_future(self._render_and_store(key, out_dir, fmt, data, job_title, translations))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def _asset(self, name: str) -> Tuple[str, bytes]:
+        path = self.assets_dir / name
+        if "/" in name or name.startswith(".") or not path.is_file():
+            raise RequestError(404, f"Asset {name} is not found")
+        return mimetypes.guess_type(name)[0] or "application/octet-stream", path.read_bytes()
+
+    async def respond(self, method: str, target: str, headers: Dict[str, str]) -> Tuple[int, str, bytes, Optional[str]]:
+        if method not in ("GET", "HEAD"):
+            return 405, "text/plain; charset=utf-8", b"Only GET and HEAD are supported\n", None
+
+        url = urlsplit(target)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            if url.path == "/health":
+                return 200, "text/plain; charset=utf-8", b"ok\n", None
+            if url.path == "/stats":
+                return 200, "application/json", json.dumps(self.stats()).encode(), None
+            if url.path == "/render":
+                output = await self.render(params.get("source", DEFAULT_SOURCE), params.get("lang"), params.get("profile"), params.get("format", "md"))
+                etag = f'"{output.key}"'
+                if headers.get("if-none-match") == etag:
+                    return 304, output.content_type, b"", etag
+                return 200, output.content_type, output.content, etag
+            if url.path.startswith(ASSETS_PATH + "/"):
+                # Asset names are fingerprinted, so the name is a strong validator
+                name = url.path[len(ASSETS_PATH) + 1:]
+                content_type, content = await asyncio.get_running_loop().run_in_executor(self.pool, self._asset, name)
+                etag = f'"{name}"'
+                if headers.get("if-none-match") == etag:
+                    return 304, content_type, b"", etag
+                return 200, content_type, content, etag
+            raise RequestError(404, f"Unknown path {url.path}")
+        except RequestError as e:
+            return e.status, "text/plain; charset=utf-8", f"{e}\n".encode(), None
+        except Exception:
+            # Traceback stays in the server log, clients do not see paths and internals
+            print_exc()
+            return 500, "text/plain; charset=utf-8", b"Internal server error\n", None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                start = perf_counter()
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3:
+                    break
+                method, target, version = parts
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                status, content_type, body, etag = await self.respond(method, target, headers)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                head = [
+                    f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+                    f"Content-Type: {content_type}",
+                    f"Content-Length: {len(body)}",
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}",
+                ]
+                if etag:
+                    head.append(f"ETag: {etag}")
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+                if method != "HEAD":
+                    writer.write(body)
+                await writer.drain()
+                print(f"{method} {target} {status} {len(body)} bytes {(perf_counter() - start) * 1000:.1f} ms")
+
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+def run_server(
+        root: Path,
+        build_dir: Path,
+        langs: List[str],
+        profiles: List[Profile],
+        host: str,
+        port: int,
+        max_workers: int,
+        cache_bytes: int,
+        compiler_name: str,
+):
+    async def serve(compiler: Compiler):
+        service = RenderService(root, build_dir, langs, profiles, max_workers, cache_bytes, compiler)
+        try:
+            service.warm()
+            server = await asyncio.start_server(service.handle, host, port)
+            print(f"Serving CVs from {service.root} on http://{host}:{port}/render?source={DEFAULT_SOURCE}&lang={langs[0]}&profile={next(iter(service.profiles))}&format=md")
+            async with server:
+                await server.serve_forever()
+        finally:
+            service.close()
+
+    build_dir.mkdir(exist_ok=True, parents=True)
+    with open_compiler(compiler_name, build_dir) as compiler:
+        try:
+            asyncio.run(serve(compiler))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,57 @@
+from gettext import GNUTranslations
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Tuple, Optional
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+
+
+SOURCES = [Path(__file__)]
+
+_ENVIRONMENTS: Dict[Tuple, Environment] = {}
+_LOCK = Lock()
+
+# Default jinja delimiters clash with LaTeX braces and percent comments
+LATEX_SYNTAX = dict(
+    block_start_string="((*",
+    block_end_string="*))",
+    variable_start_string="(((",
+    variable_end_string=")))",
+    comment_start_string="((#",
+    comment_end_string="#))",
+    trim_blocks=True,
+    lstrip_blocks=True,
+)
+
+
+def get_environment(
+        resources_dir: Path,
+        translations: GNUTranslations,
+        cache_dir: Optional[Path],
+        newstyle: bool = False,
+        trimmed: bool = False,
+        latex: bool = False,
+) -> Environment:
+    # Environment keeps translations alive, so their id is not reused while the entry exists
+    key = (resources_dir.resolve(), translations.info()["language"], id(translations), newstyle, trimmed, latex)
+    with _LOCK:
+        env = _ENVIRONMENTS.get(key)
+        if env is None:
+            bytecode_cache = None
+            if cache_dir is not None:
+                bytecode_dir = cache_dir / "jinja"
+                bytecode_dir.mkdir(exist_ok=True, parents=True)
+                bytecode_cache = FileSystemBytecodeCache(str(bytecode_dir))
+
+            env = Environment(
+                loader=FileSystemLoader(resources_dir),
+                bytecode_cache=bytecode_cache,
+                auto_reload=True,
+                extensions=['jinja2.ext.i18n'],
+                **(LATEX_SYNTAX if latex else {}),
+            )
+            env.install_gettext_translations(translations, newstyle=newstyle)
+            if trimmed:
+                env.policies["ext.i18n.trimmed"] = True
+            _ENVIRONMENTS[key] = env
+        return env
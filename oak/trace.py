@@ -0,0 +1,79 @@
+import atexit
+import json
+import os
+import threading
+
+from contextlib import nullcontext
+from functools import wraps
+from pathlib import Path
+from time import perf_counter_ns
+from typing import Callable, Optional, List, Dict, Any
+
+
+# Tracing is enabled with OAK_TRACE=<file>, the file is written in Chrome trace format (chrome://tracing, Perfetto)
+TRACE_FILE = os.environ.get("OAK_TRACE")
+
+
+class _Tracer:
+    def __init__(self, path: Path):
+        self.path = path
+        self.events: List[Dict[str, Any]] = []
+        self.pid = os.getpid()
+
+    def add(self, name: str, start_ns: int, end_ns: int, labels: Dict[str, Any]):
+        self.events.append({
+            "name": name,
+            "ph": "X",
+            "ts": start_ns / 1000,
+            "dur": (end_ns - start_ns) / 1000,
+            "pid": self.pid,
+            "tid": threading.get_ident(),
+            "args": {k: str(v) for k, v in labels.items()},
+        })
+
+    def finish(self):
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.path.write_text(json.dumps({"traceEvents": self.events}, ensure_ascii=False))
+
+        print(f"Trace written to {self.path}, slowest spans:")
+        for event in sorted(self.events, key=lambda e: e["dur"], reverse=True)[:10]:
+            labels = " ".join(f"{k}={v}" for k, v in event["args"].items())
+            print(f"  {event['dur'] / 1000:9.1f} ms  {event['name']} {labels}")
+
+
+class _Span:
+    def __init__(self, name: str, labels: Dict[str, Any]):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _tracer.add(self.name, self.start, perf_counter_ns(), self.labels)
+
+
+_tracer: Optional[_Tracer] = _Tracer(Path(TRACE_FILE)) if TRACE_FILE else None
+if _tracer:
+    atexit.register(_tracer.finish)
+
+_NULL_SPAN = nullcontext()
+
+
+def span(name: str, **labels):
+    if _tracer is None:
+        return _NULL_SPAN
+    return _Span(name, labels)
+
+
+def traced(fn: Callable) -> Callable:
+    # Decorated functions are left untouched when tracing is off
+    if _tracer is None:
+        return fn
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with _Span(fn.__qualname__, {}):
+            return fn(*args, **kwargs)
+
+    return wrapper
@@ -1,7 +1,11 @@
 import gettext
 
+from functools import lru_cache
+from hashlib import sha256
 from pathlib import Path
 
+from babel.messages.mofile import write_mo
+from babel.messages.pofile import read_po
 from oak_build import run
 
 
@@ -12,7 +16,26 @@ MESSAGES_POT = LOCALES_DIR / "messages.pot"
 
 
 def compile_translations():
-    run(f"pybabel compile -d {LOCALES_DIR}")
+    compiled = False
+    for po_file in sorted(LOCALES_DIR.glob("*/LC_MESSAGES/messages.po")):
+        mo_file = po_file.with_suffix(".mo")
+        if mo_file.exists() and mo_file.stat().st_mtime_ns >= po_file.stat().st_mtime_ns:
+            continue
+
+        locale = po_file.parent.parent.name
+        with po_file.open("rb") as f:
+            catalog = read_po(f, locale)
+        if catalog.fuzzy:
+            print(f"catalog {po_file} is marked as fuzzy, skipping")
+            continue
+
+        print(f"compiling catalog {po_file} to {mo_file}")
+        with mo_file.open("wb") as f:
+            write_mo(f, catalog)
+        compiled = True
+
+    if compiled:
+        get_translations.cache_clear()
 
 
 def update_translations():
@@ -20,6 +43,7 @@ def update_translations():
     translation_sources.append(Path("./oak_file.py"))
     translation_sources.extend(Path().glob("oak/**/*.py"))
     translation_sources.extend(Path().glob("oak/**/*.md"))
+    translation_sources.extend(Path().glob("oak/**/*.j2"))
 
     translation_sources = [str(p) for p in translation_sources if p is not None]
 
@@ -27,5 +51,11 @@ def update_translations():
     run(f"pybabel update -i {MESSAGES_POT} -d {LOCALES_DIR}")
 
 
+@lru_cache(maxsize=None)
 def get_translations(lang: str) -> gettext.GNUTranslations:
     return gettext.translation("messages", localedir=LOCALES_DIR, languages=[lang])
+
+
+def catalog_hash(translations: gettext.GNUTranslations) -> str:
+    mo_file = gettext.find("messages", localedir=LOCALES_DIR, languages=[translations.info()["language"]])
+    return sha256(Path(mo_file).read_bytes()).hexdigest()
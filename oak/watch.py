@@ -0,0 +1,173 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import fields
+from pathlib import Path
+from time import sleep, perf_counter
+from traceback import print_exc
+from typing import Dict, List, Optional, Set, Tuple
+
+from oak.cache import BuildCache
+from oak.html.html import Page, render_html, render_site_index, SOURCES as HTML_SOURCES
+from oak.jsonresume.jsonresume import render_json, SOURCES as JSON_SOURCES
+from oak.md.md import render_md, SOURCES as MD_SOURCES
+from oak.model import Data, get_all_data
+from oak.pdf.compiler import Compiler
+from oak.pdf.pdf import render_modern_cv, SOURCES as PDF_SOURCES
+from oak.profile import Profile
+from oak.translation.translation import LOCALES_DIR, compile_translations, get_translations
+
+
+RENDERERS = {
+    "md": (render_md, MD_SOURCES),
+    "jsonresume": (render_json, JSON_SOURCES),
+    "html": (render_html, HTML_SOURCES),
+    "pdf": (render_modern_cv, PDF_SOURCES),
+}
+
+Variant = Tuple[str, Profile]
+Output = Tuple[str, Profile, str]
+
+
+def _changed_fields(old: Data, new: Data) -> List[str]:
+    return [f.name for f in fields(Data) if getattr(old, f.name) != getattr(new, f.name)]
+
+
+class Watcher:
+    def __init__(
+            self,
+            build_dir: Path,
+            data_file: Path,
+            langs: List[str],
+            profiles: List[Profile],
+            formats: List[str],
+            cache: BuildCache,
+            compiler: Optional[Compiler] = None,
+            max_workers: Optional[int] = None,
+    ):
+        unsupported = [f for f in formats if f not in RENDERERS]
+        if unsupported:
+            raise Exception(f"Unsupported formats {', '.join(unsupported)}. Supported formats are {', '.join(RENDERERS)}.")
+
+        self.build_dir = build_dir
+        self.data_file = data_file.resolve()
+        self.langs = langs
+        self.variants: List[Variant] = [(lang, profile) for lang in langs for profile in profiles]
+        self.formats = formats
+        self.cache = cache
+        self.compiler = compiler
+        self.max_workers = max_workers
+        self.resolved: Dict[Variant, Data] = {}
+
+        # Python sources are not reloaded, only templates, assets and catalogs are watched
+        self.templates: Dict[Path, Set[str]] = {}
+        for fmt in formats:
+            for source in RENDERERS[fmt][1]:
+                if source.suffix != ".py":
+                    self.templates.setdefault(source.resolve(), set()).add(fmt)
+        self.catalogs = {LOCALES_DIR / lang / "LC_MESSAGES" / "messages.po": lang for lang in langs}
+
+    def files(self) -> List[Path]:
+        return [self.data_file] + list(self.templates) + list(self.catalogs)
+
+    def snapshot(self) -> Dict[Path, Optional[int]]:
+        mtimes = {}
+        for path in self.files():
+            try:
+                mtimes[path] = path.stat().st_mtime_ns
+            except FileNotFoundError:
+                mtimes[path] = None
+        return mtimes
+
+    def _resolve(self) -> Dict[Variant, Data]:
+        resolved = get_all_data(self.data_file, [(lang, profile.render_profiles) for lang, profile in self.variants], self.build_dir / "cache")
+        return {(lang, profile): resolved[(lang, profile.render_profiles)] for lang, profile in self.variants}
+
+    def affected(self, changed: Set[Path]) -> Set[Output]:
+        outputs = set()
+
+        for path in changed & set(self.templates):
+            outputs.update((lang, profile, fmt) for lang, profile in self.variants for fmt in self.templates[path])
+
+        langs = {self.catalogs[path] for path in changed & set(self.catalogs)}
+        if langs:
+            compile_translations()
+            outputs.update((lang, profile, fmt) for lang, profile in self.variants if lang in langs for fmt in self.formats)
+
+        if self.data_file in changed:
+            resolved = self._resolve()
+            for variant in self.variants:
+                old = self.resolved.get(variant)
+                new = resolved[variant]
+                if old is None or old != new:
+                    lang, profile = variant
+                    if old is not None:
+                        print(f"{lang}_{profile.name}: {', '.join(_changed_fields(old, new))} changed")
+                    outputs.update((lang, profile, fmt) for fmt in self.formats)
+            self.resolved = resolved
+
+        return outputs
+
+    def render(self, output: Output) -> Path:
+        lang, profile, fmt = output
+        data = self.resolved[(lang, profile)]
+        translations = get_translations(lang)
+        job_title = translations.gettext(profile.job_title)
+        renderer, sources = RENDERERS[fmt]
+        key = fmt
+
+        if fmt == "pdf":
+            work_dir = self.build_dir / "pdf" / "work" / f"{lang}_{profile.name}"
+            render = lambda: renderer(self.build_dir, data, job_title, translations, work_dir=work_dir, compiler=self.compiler)
+        elif fmt == "html":
+            # Every profile has its own page in the site, so profiles with equal data must not share a cache entry
+            key = f"{fmt}_{profile.name}"
+            render = lambda: renderer(self.build_dir, data, job_title, translations, profile.name) / "index.html"
+        else:
+            render = lambda: renderer(self.build_dir, data, job_title, translations)
+        return self.cache.render(key, sources, data, job_title, translations, render)
+
+    def render_site_index(self) -> Path:
+        pages = []
+        for lang, profile in self.variants:
+            translations = get_translations(lang)
+            pages.append(Page(lang, profile.name, self.resolved[(lang, profile)], translations.gettext(profile.job_title), translations))
+        return render_site_index(self.build_dir, pages)
+
+    def rebuild(self, changed: Set[Path]):
+        start = perf_counter()
+        try:
+            outputs = self.affected(changed)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                for _ in pool.map(self.render, sorted(outputs, key=lambda o: (o[0], o[1].name, o[2]))):
+                    pass
+            if any(fmt == "html" for _, _, fmt in outputs):
+                self.render_site_index()
+        except Exception:
+            print_exc()
+            return
+
+        total = len(self.variants) * len(self.formats)
+        names = ", ".join(sorted(f"{lang}_{profile.name}.{fmt}" for lang, profile, fmt in outputs))
+        print(f"Rebuilt {len(outputs)} of {total} outputs in {perf_counter() - start:.2f}s{': ' + names if names else ''}")
+
+    def run(self, interval: float, debounce: float):
+        mtimes = self.snapshot()
+        self.rebuild(set(self.files()))
+        print(f"Watching {len(mtimes)} files, press Ctrl+C to stop")
+
+        while True:
+            sleep(interval)
+            current = self.snapshot()
+            if current == mtimes:
+                continue
+
+            # Editors write in several steps, wait until files stop changing
+            while True:
+                sleep(debounce)
+                settled = self.snapshot()
+                if settled == current:
+                    break
+                current = settled
+
+            changed = {path for path in current if current[path] != mtimes.get(path)}
+            mtimes = current
+            self.rebuild(changed)
@@ -1,24 +1,16 @@
 import os
 
-from dataclasses import dataclass
 from pathlib import Path
-from shutil import rmtree, copy
-from typing import FrozenSet
+from shutil import rmtree
 
 from oak_build import task
 
-from oak.github import (
-    commit_md_to_github,
-    release_pdf as _release_pdf,
-    push_gist,
-    GitUserInfo,
-    GithubUserCredentials
-)
-from oak.md.md import render_md
-from oak.pdf.pdf import render_modern_cv
-from oak.html.html import render_html
-from oak.jsonresume.jsonresume import render_json
-from oak.model import get_data
+# Backends are imported inside their tasks, so a task only pays for the packages it uses
+from oak.cache import BuildCache
+from oak.credentials import GitUserInfo, GithubUserCredentials
+from oak.model import get_all_data
+from oak.profile import Profile
+from oak.trace import span, traced
 from oak.translation.translation import (
     compile_translations as _compile_translation,
     update_translations as _update_translation,
@@ -27,6 +19,27 @@ from oak.translation.translation import (
 
 
 BUILD_DIR = Path("./build").resolve()
+CACHE_DIR = BUILD_DIR / "cache"
+BUILD_CACHE = BuildCache(CACHE_DIR)
+PDF_WORKERS = int(os.environ.get("OAK_PDF_WORKERS", os.cpu_count() or 1))
+PDF_BACKEND = os.environ.get("OAK_PDF_BACKEND", "latex")
+PDF_COMPILER = os.environ.get("OAK_PDF_COMPILER", "docker")
+PDF_PRECOMPILED_PREAMBLE = os.environ.get("OAK_PDF_PRECOMPILED_PREAMBLE") == "1"
+PDF_OPTIMIZE = os.environ.get("OAK_PDF_OPTIMIZE") == "1"
+PDF_SIZE_BUDGET_KB = int(os.environ.get("OAK_PDF_SIZE_BUDGET_KB", 0))
+BATCH_FORMATS = os.environ.get("OAK_BATCH_FORMATS", "md,jsonresume").split(",")
+BATCH_WORKERS = int(os.environ.get("OAK_BATCH_WORKERS", os.cpu_count() or 1))
+SERVE_ROOT = Path(os.environ.get("OAK_SERVE_ROOT", ".")).resolve()
+SERVE_HOST = os.environ.get("OAK_SERVE_HOST", "127.0.0.1")
+SERVE_PORT = int(os.environ.get("OAK_SERVE_PORT", 8000))
+SERVE_WORKERS = int(os.environ.get("OAK_SERVE_WORKERS", os.cpu_count() or 1))
+SERVE_CACHE_MB = int(os.environ.get("OAK_SERVE_CACHE_MB", 256))
+WATCH_FORMATS = os.environ.get("OAK_WATCH_FORMATS", "md,jsonresume,html").split(",")
+WATCH_INTERVAL = float(os.environ.get("OAK_WATCH_INTERVAL", 0.5))
+WATCH_DEBOUNCE = float(os.environ.get("OAK_WATCH_DEBOUNCE", 0.3))
+GITHUB_API = os.environ.get("OAK_GITHUB_API", "https://api.github.com")
+RELEASE_WORKERS = int(os.environ.get("OAK_RELEASE_WORKERS", 4))
+INFO_PAGE_REMOTE = os.environ.get("OAK_INFO_PAGE_REMOTE")
 DATA_FILE = Path("data.yaml").resolve()
 
 LANGS = [
@@ -35,13 +48,6 @@ LANGS = [
 ]
 
 
-@dataclass(eq=True, frozen=True)
-class Profile:
-    name: str
-    job_title: str
-    render_profiles: FrozenSet[str]
-
-
 PROFILES = [
     Profile(
         name="teamlead",
@@ -61,11 +67,13 @@ PROFILES = [
 
 
 @task
+@traced
 def clean():
     rmtree(BUILD_DIR)
 
 
 @task
+@traced
 def github_credentials():
     return {
         "result": GithubUserCredentials(
@@ -76,6 +84,7 @@ def github_credentials():
 
 
 @task()
+@traced
 def gist_credentials():
     return {
         "result": GithubUserCredentials(
@@ -86,6 +95,7 @@ def gist_credentials():
 
 
 @task
+@traced
 def git_user():
     return {
         "result": GitUserInfo(
@@ -96,16 +106,19 @@ def git_user():
 
 
 @task
+@traced
 def compile_translation():
     _compile_translation()
 
 
 @task
+@traced
 def update_translation():
     _update_translation()
 
 
 @task(depends_on=[compile_translation])
+@traced
 def translations():
     return {
         "result": {lang: get_translations(lang) for lang in ("en", "ru")}
@@ -113,37 +126,79 @@ def translations():
 
 
 @task
+@traced
 def load_data():
+    variants = [(lang, profile) for lang in LANGS for profile in PROFILES]
+    resolved = get_all_data(DATA_FILE, [(lang, profile.render_profiles) for lang, profile in variants], CACHE_DIR)
+
     result = {}
-    for lang in LANGS:
-        for profile in PROFILES:
-            result[(lang, profile)] = get_data(DATA_FILE, lang, profile.render_profiles)
+    for lang, profile in variants:
+        result[(lang, profile)] = resolved[(lang, profile.render_profiles)]
     return {
         "result": result
     }
 
 
 @task(depends_on=[load_data, translations])
+@traced
 def md(load_data_result, translations_result):
+    from oak.md.md import render_md, SOURCES as MD_SOURCES
+
     result = {}
     for (lang, profile), data in load_data_result.items():
         translations = translations_result[lang]
         _ = translations.gettext
 
         md_type = f"{lang}_{profile.name}"
-        result[md_type] = render_md(BUILD_DIR, data, _(profile.job_title), translations)
+        job_title = _(profile.job_title)
+        with span("variant", lang=lang, profile=profile.name, format="md"):
+            result[md_type] = BUILD_CACHE.render(
+                "md", MD_SOURCES, data, job_title, translations,
+                lambda: render_md(BUILD_DIR, data, job_title, translations),
+            )
 
     return result
 
 
 @task(depends_on=[load_data, translations])
+@traced
 def pdf(load_data_result, translations_result):
-    result = []
+    jobs = []
     for (lang, profile), data in load_data_result.items():
         translations = translations_result[lang]
         _ = translations.gettext
 
-        result.append(render_modern_cv(BUILD_DIR, data, _(profile.job_title), translations))
+        jobs.append((data, _(profile.job_title), translations))
+
+    if PDF_BACKEND == "preview":
+        from oak.pdf.preview import render_preview_cv, SOURCES as PREVIEW_SOURCES
+
+        result = [
+            BUILD_CACHE.render(
+                "pdf-preview", PREVIEW_SOURCES, data, job_title, translations,
+                lambda: render_preview_cv(BUILD_DIR, data, job_title, translations),
+            )
+            for data, job_title, translations in jobs
+        ]
+    else:
+        from oak.pdf.compiler import open_compiler
+        from oak.pdf.pdf import render_modern_cv_all
+
+        with open_compiler(PDF_COMPILER, BUILD_DIR) as compiler:
+            result = render_modern_cv_all(
+                BUILD_DIR,
+                jobs,
+                max_workers=PDF_WORKERS,
+                compiler=compiler,
+                precompile_preamble=PDF_PRECOMPILED_PREAMBLE,
+                cache=BUILD_CACHE,
+                optimize=PDF_OPTIMIZE,
+            )
+
+    if PDF_SIZE_BUDGET_KB:
+        from oak.pdf.optimize import check_size_budget
+
+        check_size_budget(result, PDF_SIZE_BUDGET_KB * 1024)
 
     return {
         "result": result,
@@ -151,37 +206,117 @@ def pdf(load_data_result, translations_result):
 
 
 @task(depends_on=[load_data, translations])
-def html(load_data_result, translations_ru):
-    render_html(BUILD_DIR, load_data_result, "test-jt", translations_ru)
+@traced
+def html(load_data_result, translations_result):
+    from oak.html.html import Page, render_site
+
+    pages = []
+    for (lang, profile), data in load_data_result.items():
+        translations = translations_result[lang]
+        _ = translations.gettext
+
+        pages.append(Page(lang, profile.name, data, _(profile.job_title), translations))
+
+    return {
+        "result": render_site(BUILD_DIR, pages, cache=BUILD_CACHE),
+    }
 
 
 @task(depends_on=[load_data, translations])
+@traced
 def jsonresume(load_data_result, translations_result):
+    from oak.jsonresume.jsonresume import render_json, SOURCES as JSON_SOURCES
+
     result = {}
     for (lang, profile), data in load_data_result.items():
         translations = translations_result[lang]
         _ = translations.gettext
 
         json_type = f"{lang}_{profile.name}"
-        result[json_type] = render_json(BUILD_DIR, data, _(profile.job_title), translations)
+        job_title = _(profile.job_title)
+        with span("variant", lang=lang, profile=profile.name, format="jsonresume"):
+            result[json_type] = BUILD_CACHE.render(
+                "jsonresume", JSON_SOURCES, data, job_title, translations,
+                lambda: render_json(BUILD_DIR, data, job_title, translations),
+            )
 
     return {
         "result": result,
     }
 
 
+@task(depends_on=[compile_translation])
+@traced
+def batch(batch_source: str):
+    from oak.batch import run_batch
+
+    results = run_batch(Path(batch_source), BUILD_DIR / "batch", LANGS, PROFILES, BATCH_FORMATS, BATCH_WORKERS)
+    failed = [r.source.name for r in results if r.error]
+
+    return 1 if failed else 0, {
+        "result": {r.source.name: r.artifacts for r in results},
+    }
+
+
+@task(depends_on=[compile_translation])
+@traced
+def serve():
+    from oak.server import run_server
+
+    run_server(
+        SERVE_ROOT,
+        BUILD_DIR / "serve",
+        LANGS,
+        PROFILES,
+        SERVE_HOST,
+        SERVE_PORT,
+        SERVE_WORKERS,
+        SERVE_CACHE_MB * 1024 * 1024,
+        PDF_COMPILER,
+    )
+
+
+@task(depends_on=[compile_translation])
+@traced
+def watch():
+    from oak.pdf.compiler import open_compiler
+    from oak.watch import Watcher
+
+    with open_compiler(PDF_COMPILER, BUILD_DIR) as compiler:
+        watcher = Watcher(BUILD_DIR, DATA_FILE, LANGS, PROFILES, WATCH_FORMATS, BUILD_CACHE, compiler, PDF_WORKERS)
+        try:
+            watcher.run(WATCH_INTERVAL, WATCH_DEBOUNCE)
+        except KeyboardInterrupt:
+            pass
+
+
 @task(depends_on=[md, github_credentials, git_user])
+@traced
 def commit_en_md(md_en_java_senior, git_user_result, github_credentials_result):
-    commit_md_to_github(md_en_java_senior, git_user_result, github_credentials_result)
+    from oak.github import commit_md_to_github
+
+    commit_md_to_github(
+        {"cv.md": md_en_java_senior},
+        git_user_result,
+        github_credentials_result,
+        CACHE_DIR / "info-page",
+        INFO_PAGE_REMOTE,
+    )
 
 
 @task(depends_on=[pdf, github_credentials])
+@traced
 def release_pdf(pdf_result, github_credentials_result):
-    _release_pdf(pdf_result, github_credentials_result)
+    from oak.github import release_pdf as _release_pdf
+
+    _release_pdf(pdf_result, github_credentials_result, GITHUB_API, RELEASE_WORKERS)
 
 
 @task(depends_on=[jsonresume, gist_credentials])
+@traced
 def push_jsonresume_gist(jsonresume_result, gist_credentials_result):
+    from oak.github import push_gist
+
     resume_file = jsonresume_result["en_java_senior"]
 
     push_gist(resume_file, "522c594d695740bc8bd0e97160305bab", gist_credentials_result)